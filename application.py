@@ -1,14 +1,24 @@
-import bottle
-from bottle import route
-# from bottle.ext import sqlalchemy
-import bottle.ext.sqlalchemy
-import latci.database
+from latci.startup import phase
+
+with phase('import bottle and plugins'):
+    import bottle
+    from bottle import route
+    # from bottle.ext import sqlalchemy
+    import bottle.ext.sqlalchemy
 import functools
 
-from latci import config
+with phase('configuration'):
+    from latci import config
+    import latci.log
+    latci.log.setup(
+        level=config.LOG_LEVEL, filename=config.LOG_FILE, queue_size=config.LOG_QUEUE_SIZE, debug_sql=config.DEBUG_SQL
+    )
+with phase('database engines'):
+    import latci.database
 import latci.json
 
 application = bottle.app()
+latci.log.install(application)
 application.uninstall(bottle.JSONPlugin)
 application.install(bottle.JSONPlugin(json_dumps=functools.partial(latci.json.dumps, indent=True)))
 
@@ -26,7 +36,8 @@ application.install(
 
 
 # Required for proper initialization of routes.  Can't be before bottle.app() calls.
-import latci.views
+with phase('models and routes'):
+    import latci.views
 
 
 # This route conflicts with all other routes, and because of how bottle handles routes, it would always win if it was
@@ -34,6 +45,14 @@ import latci.views
 # and works around this behavior.  Yes, it's a kludge, but really whatever framework is serving us should be doing the
 # entire serving static files thing anyways.
 if config.SERVE_STATIC_FILES:
+    import latci.static
+    static_files = latci.static.StaticFiles(
+        config.STATIC_FILES_PATH,
+        max_cached_size=config.STATIC_CACHE_MAX_SIZE, check_interval=config.STATIC_CACHE_CHECK_SECONDS
+    )
+    with phase('static files'):
+        static_files.preload()
+
     @route('/', skip=True)
     @route('/<path:path>', skip=True, method='ANY')
     def serve_static_files(path=None):
@@ -41,7 +60,7 @@ if config.SERVE_STATIC_FILES:
             raise bottle.HTTPError(status=405, headers={'Allow': 'GET, HEAD'})
         if path is None:
             path = 'index.html'
-        return bottle.static_file(path, root=config.STATIC_FILES_PATH)
+        return static_files(path)
 
 
 @route('/static/<path:path>', skip=True)
@@ -49,7 +68,20 @@ def serve_static_files(path):
     return bottle.static_file(path, root='../static/')
 
 
-runserver = functools.partial(bottle.run, host='0.0.0.0', port=8000, debug=True)
+# Everything above needs the bottle application itself, so wrap it last.
+if config.COMPRESS_RESPONSES:
+    import latci.middleware
+    application = latci.middleware.CompressionMiddleware(
+        application, min_size=config.COMPRESS_MIN_SIZE, level=config.COMPRESS_LEVEL
+    )
+
+
+if config.WARM_UP:
+    import latci.startup
+    latci.startup.warm_up(connections=config.WARM_UP_CONNECTIONS)
+
+
+runserver = functools.partial(bottle.run, app=application, host='0.0.0.0', port=8000, debug=True)
 
 
 def cli_shell():
@@ -119,6 +151,156 @@ def cli_docs():
     pydoc.browse()
     return 0
 
+def cli_archive():
+    """
+    CLI option for moving long-inactive students, staff and activities (and their attendance) to their archive tables.
+    """
+    import sqlalchemy
+    from latci.database import engine
+
+    with engine.begin() as conn:
+        result = conn.execute(
+            sqlalchemy.text("SELECT * FROM archive_inactive(:days * INTERVAL '1 day')"),
+            days=config.ARCHIVE_INACTIVE_DAYS
+        )
+        for table, count in result:
+            print("Archived {} row(s) from {}.".format(count, table))
+    return 0
+
+def cli_maintain_history():
+    """
+    CLI option for applying the attendance history retention policy.
+    """
+    import sqlalchemy
+    from latci.database import engine
+
+    with engine.begin() as conn:
+        result = conn.execute(
+            sqlalchemy.text(
+                "SELECT * FROM attendance_history_maintain("
+                "NULLIF(:compact, 0) * INTERVAL '1 day', NULLIF(:retain, 0) * INTERVAL '1 day')"
+            ),
+            compact=config.HISTORY_COMPACT_DAYS, retain=config.HISTORY_RETAIN_DAYS
+        )
+        for partition, action in result:
+            print("{}: {}".format(partition, action))
+    return 0
+
+def cli_maintain_partitions():
+    """
+    CLI option for pre-creating upcoming attendance and history partitions (moving in any rows that landed in the
+    DEFAULT partitions) and detaching expired ones.
+    """
+    import sqlalchemy
+    from latci.database import engine
+
+    with engine.begin() as conn:
+        result = conn.execute(
+            sqlalchemy.text("SELECT * FROM attendance_maintain_partitions(:ahead, NULLIF(:detach, 0) * INTERVAL '1 day')"),
+            ahead=config.ATTENDANCE_MONTHS_AHEAD, detach=config.ATTENDANCE_DETACH_DAYS
+        )
+        for partition, action in result:
+            print("{}: {}".format(partition, action))
+    return 0
+
+def cli_import(kind, filename, skip_invalid=False):
+    """
+    CLI option for bulk importing a CSV or NDJSON file.  The format is determined by the file extension.
+    """
+    import os
+    import latci.importer
+
+    fmt = 'csv' if os.path.splitext(filename)[1].lower() == '.csv' else 'ndjson'
+    db = latci.database.Session()
+    importer = latci.importer.Importer(db, kind)
+    try:
+        with open(filename, 'rb') as fp:
+            result = importer.run(fp, fmt, skip_invalid=skip_invalid)
+        for error in importer.errors:
+            print(error.text)
+        if importer.errors and not skip_invalid:
+            print("Nothing was imported due to errors.")
+            db.rollback()
+            return 1
+        db.commit()
+    finally:
+        db.close()
+    print("Inserted {inserted} and updated {updated} row(s).".format(**result))
+    return 0
+
+def cli_profile_startup(top=25):
+    """
+    CLI option for reporting how long importing the application takes, by phase and by module.
+
+    The import is done in a fresh interpreter, so nothing is already loaded.  Per-module times need Python 3.7 or later.
+    """
+    import json
+    import os
+    import subprocess
+    import sys
+
+    script = (
+        "import time, json\n"
+        "started = time.perf_counter()\n"
+        "import application\n"
+        "imported = time.perf_counter()\n"
+        "import latci.startup\n"
+        "error = None\n"
+        "try:\n"
+        "    latci.startup.warm_up(connections=application.config.WARM_UP_CONNECTIONS)\n"
+        "except Exception as ex:\n"
+        "    error = repr(ex)\n"
+        "print(json.dumps({'import': imported - started, 'total': time.perf_counter() - started,"
+        " 'phases': latci.startup.phases, 'error': error}))\n"
+    )
+    args = [sys.executable]
+    if sys.version_info >= (3, 7):
+        args += ['-X', 'importtime']
+    result = subprocess.run(
+        args + ['-c', script], cwd=os.path.dirname(os.path.abspath(__file__)),
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True
+    )
+    if result.returncode:
+        print(result.stderr)
+        return result.returncode
+
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    print("Importing application: {:8.1f} ms".format(report['import'] * 1000))
+    print("Including warm-up:     {:8.1f} ms".format(report['total'] * 1000))
+    if report['error']:
+        print("Warm-up failed: {}".format(report['error']))
+    print()
+    print("Phases:")
+    for name, seconds in report['phases']:
+        print("  {:8.1f} ms  {}".format(seconds * 1000, name))
+
+    # Lines look like: "import time:       123 |        456 |   package.module"
+    modules = []
+    packages = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        try:
+            own, cumulative = int(fields[0]), int(fields[1])
+        except ValueError:
+            continue  # Header line
+        name = fields[2].strip()
+        modules.append((cumulative, own, name))
+        package = name.split('.')[0]
+        packages[package] = packages.get(package, 0) + own
+
+    if modules:
+        print()
+        print("Slowest modules (cumulative, self):")
+        for cumulative, own, name in sorted(modules, reverse=True)[:top]:
+            print("  {:8.1f} ms {:8.1f} ms  {}".format(cumulative / 1000, own / 1000, name))
+        print()
+        print("Import time by top-level package:")
+        for package, own in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]:
+            print("  {:8.1f} ms  {}".format(own / 1000, package))
+    return 0
+
 def main(argv):
     """
     Main entry point.
@@ -129,6 +311,18 @@ def main(argv):
         sys.exit(cli_shell())
     elif 'docs' in sys.argv:
         sys.exit(cli_docs())
+    elif 'archive' in sys.argv:
+        sys.exit(cli_archive())
+    elif 'maintain-history' in sys.argv:
+        sys.exit(cli_maintain_history())
+    elif 'maintain-partitions' in sys.argv:
+        sys.exit(cli_maintain_partitions())
+    elif 'profile-startup' in sys.argv:
+        sys.exit(cli_profile_startup())
+    elif 'import' in sys.argv:
+        # application.py import <student|staff|activity|enrollment> <filename> [--skip-invalid]
+        args = sys.argv[sys.argv.index('import') + 1:]
+        sys.exit(cli_import(args[0], args[1], skip_invalid='--skip-invalid' in args))
     runserver()
 
 if __name__ == '__main__':
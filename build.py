@@ -1,7 +1,6 @@
 """
 Handles building the project and deploying to AWS via awsebcli
 """
-import operator
 import sys
 import functools
 import re
@@ -16,6 +15,18 @@ BUILD_INCLUDES = (
     "-__pycache__;-.*;-*.py[cod];-server.ini;+/.ebextensions/"
 )
 
+# Client assets that are fingerprinted, relative to the client directory
+CLIENT_ROOT = 'client'
+CLIENT_INDEX = 'index.html'
+CLIENT_MANIFEST = 'asset-manifest.json'
+
+# Where the client's scripts and partial templates are bundled to, relative to the client directory
+CLIENT_BUNDLE = 'scripts/bundle.js'
+CLIENT_PARTIALS = 'partials'
+
+# File types that get a precompressed .gz sibling
+PRECOMPRESS_SUFFIXES = {'.html', '.js', '.css', '.json', '.svg', '.txt', '.map'}
+
 def _verbose_exec(cmd, *a, _fn, **kw):
     import shlex
     print("# running: ", " ".join(shlex.quote(arg) for arg in cmd))
@@ -127,51 +138,511 @@ def cmd_setup_server(path='venv', use_current=False):
     check_call([pip, 'install', '-r', 'requirements.txt'])
 
 
-def cmd_build(file, ini_override='deploy/server.ini', verbose=False):
+def gzip_bytes(data):
+    """Gzips data reproducibly (no timestamp in the header), so identical inputs build identical artifacts."""
+    import gzip
+    import io
+
+    buf = io.BytesIO()
+    with gzip.GzipFile(fileobj=buf, mode='wb', compresslevel=9, mtime=0) as fp:
+        fp.write(data)
+    return buf.getvalue()
+
+
+def bundle_client(root, files, verbose=False):
+    """
+    Bundles the client's own scripts and partial templates into a single script.
+
+    The scripts in index.html's injector:js block are concatenated in order, followed by a run block that preloads every
+    partial into Angular's $templateCache under the same URL the router requests it by.  The injector block is replaced
+    by a single reference to the bundle.
+
+    :param root: Project root.
+    :param files: Set of paths being built.
+    :param verbose: If True, lists bundled files.
+    :return: Dictionary of archive names to file contents that should be added to (or replace files in) the build.
+    """
+    import json
+    import posixpath
+
+    client = root.joinpath(CLIENT_ROOT)
+    index = client.joinpath(CLIENT_INDEX)
+    if index not in files:
+        return {}
+
+    html = index.read_text(encoding='utf-8')
+    block = re.search(r'<!--\s*injector:js\s*-->(.*?)<!--\s*endinjector\s*-->', html, re.DOTALL)
+    if not block:
+        print("*** No injector:js block in {}, not bundling.".format(index.as_posix()))
+        return {}
+
+    parts = []
+    scripts = re.findall(r'<script[^>]*\ssrc\s*=\s*["\']([^"\']+)["\']', block.group(1))
+    for url in scripts:
+        path = client.joinpath(url)
+        if path not in files:
+            raise RuntimeError("*** {} refers to {}, which is not part of the build.".format(index.as_posix(), url))
+        if verbose: print("bundling {}".format(url))
+        parts.append("/* {} */\n{}\n;".format(url, path.read_text(encoding='utf-8')))
+
+    partials = sorted(
+        path for path in files
+        if path.suffix == '.html' and path.parent == client.joinpath(CLIENT_PARTIALS)
+    )
+    if partials:
+        templates = []
+        for path in partials:
+            url = path.relative_to(client).as_posix()
+            if verbose: print("bundling {}".format(url))
+            templates.append("  $templateCache.put({}, {});".format(
+                json.dumps(url), json.dumps(path.read_text(encoding='utf-8'))
+            ))
+        parts.append(
+            "/* Preloaded partials */\n"
+            "angular.module('app').run(['$templateCache', function($templateCache) {{\n{}\n}}]);".format(
+                "\n".join(templates)
+            )
+        )
+
+    html = html[:block.start(1)] + '\n    <script src="{}"></script>\n    '.format(CLIENT_BUNDLE) + html[block.end(1):]
+    print("Bundled {} scripts and {} partials into {}.".format(len(scripts), len(partials), CLIENT_BUNDLE))
+    return {
+        posixpath.join(CLIENT_ROOT, CLIENT_INDEX): html.encode('utf-8'),
+        posixpath.join(CLIENT_ROOT, CLIENT_BUNDLE): "\n\n".join(parts).encode('utf-8'),
+    }
+
+
+def fingerprint_client(root, files, verbose=False, previous=None):
+    """
+    Content-hashes the local assets referenced by the client's index.html.
+
+    Each referenced asset gets a copy named name.<hash>.ext alongside the original, index.html is rewritten to point to
+    the copies, and a manifest mapping original to fingerprinted paths is written to the client directory.  Text files
+    among these (and index.html itself) also get a precompressed .gz sibling.
+
+    Fingerprinted copies live in the same directory as the original, so relative URLs inside stylesheets still work.
+
+    :param root: Project root.
+    :param files: Set of paths being built.
+    :param verbose: If True, lists fingerprinted files.
+    :param previous: Output of earlier build stages, which takes precedence over files on disk.
+    :return: Dictionary of archive names to file contents that should be added to (or replace files in) the build.
+    """
+    import hashlib
+    import json
+    import posixpath
+
+    client = root.joinpath(CLIENT_ROOT)
+    index = client.joinpath(CLIENT_INDEX)
+    if index not in files:
+        return {}
+    previous = previous or {}
+
+    def read(path):
+        arcname = path.relative_to(root).as_posix()
+        if arcname in previous:
+            return previous[arcname]
+        if path in files:
+            return path.read_bytes()
+        return None
+
+    generated = {}
+    manifest = {}
+
+    def add(relname, data):
+        arcname = posixpath.join(CLIENT_ROOT, relname)
+        generated[arcname] = data
+        if posixpath.splitext(relname)[1] in PRECOMPRESS_SUFFIXES:
+            compressed = gzip_bytes(data)
+            if len(compressed) < len(data):
+                generated[arcname + '.gz'] = compressed
+
+    def replace(match):
+        url = match.group(2)
+        if url in manifest:
+            return match.group(1) + manifest[url] + match.group(3)
+        if '://' in url or url.startswith('//') or url.startswith('data:'):
+            return match.group(0)
+        path = client.joinpath(url.split('?')[0].split('#')[0])
+        data = read(path)
+        if data is None:
+            return match.group(0)
+        digest = hashlib.sha256(data).hexdigest()[:12]
+        stem, ext = posixpath.splitext(path.relative_to(client).as_posix())
+        fingerprinted = '{}.{}{}'.format(stem, digest, ext)
+        manifest[url] = fingerprinted
+        add(fingerprinted, data)
+        if verbose: print("{} -> {}".format(url, fingerprinted))
+        return match.group(1) + fingerprinted + match.group(3)
+
+    html = re.sub(r'((?:src|href)\s*=\s*["\'])([^"\']+)(["\'])', replace, read(index).decode('utf-8'))
+    add(CLIENT_INDEX, html.encode('utf-8'))
+    generated[posixpath.join(CLIENT_ROOT, CLIENT_MANIFEST)] = json.dumps(manifest, indent=2, sort_keys=True).encode()
+    print("Fingerprinted {} client assets.".format(len(manifest)))
+    return generated
+
+
+def target_version(python):
+    """Returns the (major, minor) version of the given interpreter."""
+    output = subprocess.check_output(
+        [python, '-c', 'import sys; print("%d.%d" % sys.version_info[:2])'], universal_newlines=True
+    )
+    return tuple(int(part) for part in output.strip().split('.'))
+
+
+def compile_bytecode(root, files, python, verbose=False):
+    """
+    Compiles the latci package to bytecode with the target interpreter.
+
+    Both the normal and the optimized (-O) forms are produced, so the instance can use them regardless of whether it runs
+    with PYTHONOPTIMIZE.  Interpreters that support it get hash-checked .pyc files, which remain valid even if
+    extracting the artifact doesn't preserve source timestamps.
+
+    :param root: Project root.
+    :param files: Set of paths being built.
+    :param python: Path to the interpreter the artifact will run under.
+    :param verbose: If True, lists compiled files.
+    :return: Dictionary of archive names to .pyc file contents.
+    """
     import pathlib
-    import zipfile
-    root = pathlib.Path('.')
-    files = set()
+    import shutil
+    import tempfile
+
+    version = target_version(python)
+    sources = [path for path in files if path.suffix == '.py' and path.parts[0] == 'latci']
+    print("Compiling {} modules for Python {}.{}...".format(len(sources), *version))
+
+    generated = {}
+    with tempfile.TemporaryDirectory() as stage:
+        stage = pathlib.Path(stage)
+        for path in sources:
+            target = stage.joinpath(path.relative_to(root))
+            target.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copy2(path.as_posix(), target.as_posix())
+
+        args = ['-m', 'compileall', '-q', '-d', 'latci']
+        if version >= (3, 7):
+            args += ['--invalidation-mode', 'checked-hash']
+        for optimize in ([], ['-O']):
+            check_call([python] + optimize + args + [stage.joinpath('latci').as_posix()], **std_passthru)
+
+        for path in stage.glob('**/__pycache__/*.py[co]'):
+            relname = path.relative_to(stage).as_posix()
+            if verbose: print(relname)
+            generated[relname] = path.read_bytes()
+    return generated
 
-    server_ini = root.joinpath(ini_override)
-    if not server_ini.exists():
-        raise RuntimeError("*** server.ini override located at {} does not exist.".format(server_ini))
 
-    print("Building list of files to include...")
+def build_wheelhouse(python, requirements='requirements.txt', verbose=False):
+    """
+    Builds wheels for everything in requirements.txt with the target interpreter.
 
-    def compile_pattern(pattern, allow_custom_op=True, default_op=operator.ior):
-        if ';' in pattern:
-            for subpattern in pattern.split(';'):
-                yield from compile_pattern(subpattern, allow_custom_op, default_op)
-            return
+    The artifact's requirements.txt is rewritten to install only from the bundled wheelhouse, so instances don't need
+    to reach PyPI or compile anything from source at deploy time.  The wheels must be built on a platform matching the
+    instances for this to work with packages that have C extensions, such as psycopg2 and cryptography.
 
-        if allow_custom_op and pattern[0] in '-+':
-            mode, pattern = pattern[0], pattern[1:]
-            op = operator.ior if mode == '+' else operator.isub
+    :param python: Path to the interpreter the artifact will run under.
+    :param requirements: Path to the requirements file.
+    :param verbose: If True, lists bundled wheels.
+    :return: Dictionary of archive names to file contents.
+    """
+    import pathlib
+    import tempfile
+
+    generated = {}
+    with tempfile.TemporaryDirectory() as wheelhouse:
+        check_call([python, '-m', 'pip', 'wheel', '-r', requirements, '-w', wheelhouse], **std_passthru)
+        for path in sorted(pathlib.Path(wheelhouse).glob('*.whl')):
+            relname = 'wheelhouse/' + path.name
+            if verbose: print(relname)
+            generated[relname] = path.read_bytes()
+
+    with open(requirements, encoding='utf-8') as fp:
+        original = fp.read()
+    generated['requirements.txt'] = (
+        "# Install from the wheelhouse bundled by build.py\n--no-index\n--find-links wheelhouse\n\n" + original
+    ).encode('utf-8')
+    print("Bundled {} wheels.".format(len(generated) - 1))
+    return generated
+
+
+def compile_includes(pattern, allow_custom_op=True, default_include=True):
+    """
+    Compiles a BUILD_INCLUDES-style pattern list into (include, regex) pairs, applied in order.
+
+    Patterns starting with / are relative to the project root; others match at any depth.  A pattern also matches
+    everything below a directory it matches.  Prefix a pattern with + to include or - to exclude matching files.
+    """
+    result = []
+    for subpattern in pattern.split(';'):
+        if not subpattern:
+            continue
+        include = default_include
+        if allow_custom_op and subpattern[0] in '-+':
+            include, subpattern = subpattern[0] == '+', subpattern[1:]
+
+        if subpattern[0] != '/':
+            regex = '(?:.*/)?'
         else:
-            op = default_op
+            regex = ''
+            subpattern = subpattern[1:]
+        for part in re.split(r'(\*|\?|\[[^\]]*\])', subpattern.rstrip('/')):
+            if part == '*':
+                regex += '[^/]*'
+            elif part == '?':
+                regex += '[^/]'
+            elif part.startswith('[') and part.endswith(']') and len(part) > 2:
+                regex += '[' + part[1:-1].replace('\\', '\\\\') + ']'
+            else:
+                regex += re.escape(part)
+        result.append((include, re.compile(regex + '(?:/.*)?$')))
+    return result
+
+
+def select_files(root, includes):
+    """
+    Returns the set of files under root selected by compiled includes, walking the tree once.
+
+    :param root: Project root.
+    :param includes: Output of compile_includes()
+    """
+    files = set()
+    for dirpath, dirnames, filenames in os.walk(root.as_posix()):
+        dirnames[:] = [name for name in dirnames if name != '.git']
+        for filename in filenames:
+            path = root.joinpath(os.path.relpath(os.path.join(dirpath, filename), root.as_posix()))
+            relname = path.relative_to(root).as_posix()
+            selected = False
+            for include, regex in includes:
+                if selected != include and regex.match(relname):
+                    selected = include
+            if selected:
+                files.add(path)
+    return files
+
+
+def _deflate(data):
+    """Returns the raw DEFLATE stream and CRC-32 of data, as stored in a zip member."""
+    import zlib
+
+    compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush(), zlib.crc32(data) & 0xFFFFFFFF
+
+
+def _read_raw_member(archive, info):
+    """Returns the still-compressed data of a zip member."""
+    import struct
+    import zipfile
+
+    archive.fp.seek(info.header_offset)
+    header = archive.fp.read(zipfile.sizeFileHeader)
+    name_length, extra_length = struct.unpack('<HH', header[26:30])
+    archive.fp.seek(info.header_offset + zipfile.sizeFileHeader + name_length + extra_length)
+    return archive.fp.read(info.compress_size)
+
 
-        if pattern[0] != '/':
-            pattern = '**/' + pattern
+# Python versions whose zipfile internals _write_raw_member() has been checked against.
+RAW_ZIP_MEMBER_VERSIONS = ((3, 6), (3, 13))
+
+
+def raw_zip_members_supported(version=None):
+    """
+    Returns True if _write_raw_member() can be used with this version of Python.
+
+    :param version: (major, minor) tuple.  Defaults to the running interpreter.
+    """
+    low, high = RAW_ZIP_MEMBER_VERSIONS
+    return low <= (version or tuple(sys.version_info[:2])) <= high
+
+
+def _write_raw_member(archive, info, data):
+    """
+    Writes already-compressed data to a zip as a new member.  info must have its CRC and sizes filled in.
+
+    zipfile has no public API for this, so this follows what ZipFile._open_to_write() and _ZipWriteFile.close() do for a
+    seekable file, minus the compression: the same checks, the same choice of ZIP64 local header, and the same
+    bookkeeping.  Only use it if raw_zip_members_supported() returns True, and only when asked to (see the raw_members
+    parameter of write_artifact().)  write_artifact() verifies the result with ZipFile.testzip() before using it.
+    """
+    import zipfile
+
+    if archive._writing:
+        raise ValueError("Can't write a raw member while another write handle is open.")
+    zip64 = info.file_size > zipfile.ZIP64_LIMIT or info.compress_size > zipfile.ZIP64_LIMIT
+    if zip64 and not archive._allowZip64:
+        raise zipfile.LargeZipFile("Filesize would require ZIP64 extensions")
+    info.flag_bits &= ~0x08  # Sizes are in the local header, no data descriptor follows.
+    with archive._lock:
+        archive.fp.seek(archive.start_dir)
+        info.header_offset = archive.fp.tell()
+        archive._writecheck(info)
+        archive._didModify = True
+        archive.fp.write(info.FileHeader(zip64))
+        archive.fp.write(data)
+        archive.start_dir = archive.fp.tell()
+        archive.filelist.append(info)
+        archive.NameToInfo[info.filename] = info
+
+
+def write_artifact(file, members, incremental=True, jobs=None, verbose=False, raw_members=False):
+    """
+    Writes the build artifact, reusing unchanged members of the previous one.
+
+    A manifest of each member's SHA-256 is kept next to the artifact.  Members whose hash matches the previous build are
+    copied from the previous artifact, and the rest are compressed from scratch.  The new artifact is checked with
+    ZipFile.testzip() before it replaces the old one.
+
+    By default, everything is written with zipfile's public API, so copied members are recompressed.  With raw_members,
+    copied members keep their compressed data and the rest are compressed in parallel (zlib releases the GIL while
+    compressing, so threads are enough to use every core), which is much faster but relies on zipfile internals.  It
+    is ignored on Pythons outside RAW_ZIP_MEMBER_VERSIONS.
+
+    :param file: Artifact filename.
+    :param members: Dictionary of archive names to either a pathlib.Path or file contents as bytes.
+    :param incremental: If False, ignore the previous artifact and recompress everything.
+    :param jobs: Number of compression threads, with raw_members.  Defaults to the number of CPUs.
+    :param verbose: If True, also lists unchanged files.
+    :param raw_members: If True, copy and write compressed member data directly.  See _write_raw_member().
+    """
+    import concurrent.futures
+    import hashlib
+    import json
+    import shutil
+    import time
+    import zipfile
+
+    manifest_file = file + '.manifest.json'
+    previous = {}
+    if os.path.exists(manifest_file):
+        with open(manifest_file, encoding='utf-8') as fp:
+            previous = json.load(fp)
+
+    contents = {}
+    attributes = {}
+    for name, source in members.items():
+        if isinstance(source, bytes):
+            contents[name] = source
+            attributes[name] = (0o100644 << 16, (1980, 1, 1, 0, 0, 0))
+        else:
+            contents[name] = source.read_bytes()
+            stat = source.stat()
+            attributes[name] = ((stat.st_mode & 0xFFFF) << 16, time.localtime(stat.st_mtime)[:6])
+    hashes = {name: hashlib.sha256(data).hexdigest() for name, data in contents.items()}
+
+    old_archive = None
+    reuse = set()
+    if incremental and previous and os.path.exists(file):
+        try:
+            old_archive = zipfile.ZipFile(file)
+        except zipfile.BadZipFile:
+            print("*** Previous artifact is corrupt, rebuilding from scratch.")
         else:
-            pattern = pattern[1:]
+            old_names = set(old_archive.NameToInfo)
+            reuse = {name for name in contents if previous.get(name) == hashes[name] and name in old_names}
+
+    raw = raw_members and raw_zip_members_supported()
+    if raw_members and not raw:
+        print("*** Python {}.{} is not known to support raw zip members, using zipfile's own API instead.".format(
+            *sys.version_info[:2]
+        ))
+
+    # Already-compressed members gain nothing from being deflated again.
+    stored = {name for name in contents if name.endswith(('.gz', '.whl', '.zip'))}
+    pending = sorted(name for name in contents if raw and name not in reuse and name not in stored)
+    started = time.time()
+    with concurrent.futures.ThreadPoolExecutor(jobs or os.cpu_count() or 1) as pool:
+        compressed = dict(zip(pending, pool.map(_deflate, (contents[name] for name in pending))))
+
+    temp_file = file + '.tmp'
+    try:
+        with zipfile.ZipFile(temp_file, mode='w') as archive:
+            for name in sorted(contents):
+                info = zipfile.ZipInfo(name, date_time=attributes[name][1])
+                info.external_attr = attributes[name][0]
+                info.file_size = len(contents[name])
+                if not raw:
+                    if name in reuse:
+                        old = old_archive.getinfo(name)
+                        info.compress_type, info.date_time = old.compress_type, old.date_time
+                        with old_archive.open(old) as source, archive.open(info, 'w') as target:
+                            shutil.copyfileobj(source, target, 65536)
+                    else:
+                        info.compress_type = zipfile.ZIP_STORED if name in stored else zipfile.ZIP_DEFLATED
+                        archive.writestr(info, contents[name])
+                    continue
+                if name in reuse:
+                    old = old_archive.getinfo(name)
+                    data = _read_raw_member(old_archive, old)
+                    info.compress_type, info.CRC, info.date_time = old.compress_type, old.CRC, old.date_time
+                elif name in stored:
+                    data = contents[name]
+                    info.compress_type, info.CRC = zipfile.ZIP_STORED, zipfile.crc32(data) & 0xFFFFFFFF
+                else:
+                    data, info.CRC = compressed[name]
+                    info.compress_type = zipfile.ZIP_DEFLATED
+                info.compress_size = len(data)
+                _write_raw_member(archive, info, data)
+        with zipfile.ZipFile(temp_file) as archive:
+            bad = archive.testzip()
+        if bad is not None:
+            raise RuntimeError("*** Verification of the new artifact failed at {}.".format(bad))
+    except BaseException:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        raise
+    finally:
+        if old_archive is not None:
+            old_archive.close()
+    os.replace(temp_file, file)
+    with open(manifest_file, 'w', encoding='utf-8') as fp:
+        json.dump(hashes, fp, indent=2, sort_keys=True)
+
+    added = sorted(set(hashes) - set(previous))
+    removed = sorted(set(previous) - set(hashes))
+    changed = sorted(name for name in hashes if name in previous and previous[name] != hashes[name])
+    if previous or verbose:
+        # Without a previous build, everything is new and there's nothing interesting to list.
+        for label, names in (('added', added), ('changed', changed), ('removed', removed)):
+            for name in names:
+                print("  {:8} {}".format(label, name))
+    if verbose:
+        for name in sorted(reuse):
+            print("  {:8} {}".format('same', name))
+    print(
+        "Wrote {} files to {} in {:.2f}s: {} added, {} changed, {} removed, {} reused from the previous build.".format(
+            len(contents), file, time.time() - started, len(added), len(changed), len(removed), len(reuse)
+        )
+    )
 
-        yield op, pattern
-        if pattern[-1] != '/':
-            pattern += '/'
-        yield op, pattern + '**/*'
 
-    for op, pattern in compile_pattern(BUILD_INCLUDES):
-        files = op(files, set(root.glob(pattern)))
+def cmd_build(
+        file, ini_override='deploy/server.ini', verbose=False, fingerprint=True, bundle=True,
+        precompile=False, wheelhouse=False, python=None, incremental=True, jobs=None, raw_zip=False
+):
+    import pathlib
+    root = pathlib.Path('.')
 
-    print("Adding {} files to {}".format(len(files), file))
-    with zipfile.ZipFile(file, mode='w', compression=zipfile.ZIP_DEFLATED) as zip:
-        for path in sorted(files):
-            relname = path.relative_to(root).as_posix()
-            if verbose: print(relname)
-            zip.write(path.as_posix(), arcname=relname)
-        zip.write(server_ini.as_posix(), arcname='server.ini')
-        print("Added server.ini to {} (from {})".format(file, server_ini.as_posix()))
+    server_ini = root.joinpath(ini_override)
+    if not server_ini.exists():
+        raise RuntimeError("*** server.ini override located at {} does not exist.".format(server_ini))
+
+    print("Building list of files to include...")
+    files = select_files(root, compile_includes(BUILD_INCLUDES))
+
+    generated = bundle_client(root, files, verbose=verbose) if bundle else {}
+    if fingerprint:
+        # Fingerprinting replaces the bundled index.html, but the bundle itself is still needed.
+        generated.update(fingerprint_client(root, files, verbose=verbose, previous=generated))
+    if precompile:
+        generated.update(compile_bytecode(root, files, python or sys.executable, verbose=verbose))
+    if wheelhouse:
+        generated.update(build_wheelhouse(python or sys.executable, verbose=verbose))
+
+    members = {path.relative_to(root).as_posix(): path for path in files}
+    members.update(generated)
+    members['server.ini'] = server_ini
+    print("Added server.ini (from {})".format(server_ini.as_posix()))
+    write_artifact(file, members, incremental=incremental, jobs=jobs, verbose=verbose, raw_members=raw_zip)
 
 
 def cmd_deploy(eb, environment, label, message):
@@ -285,6 +756,44 @@ group.add_argument(
     '--list-files', action='store_const', const=True, default=False, dest='list_files',
     help="List files included in build."
 )
+group.add_argument(
+    '--no-fingerprint', action='store_const', const=False, default=True, dest='fingerprint',
+    help="Don't fingerprint and precompress client assets."
+)
+group.add_argument(
+    '--no-bundle', action='store_const', const=False, default=True, dest='bundle',
+    help="Don't bundle client scripts and partials into a single script."
+)
+group.add_argument(
+    '--full', action='store_const', const=False, default=True, dest='incremental',
+    help="Recompress every file instead of reusing unchanged ones from the previous artifact."
+)
+group.add_argument(
+    '--raw-zip', action='store_const', const=True, default=False, dest='raw_zip',
+    help=(
+        "Copy unchanged files from the previous artifact without recompressing them, and compress the rest in"
+        " parallel.  Faster, but relies on zipfile internals, so it's only used on Python versions it was checked with."
+    )
+)
+group.add_argument(
+    '-j, --jobs', nargs=1, type=int, metavar='N', dest='jobs',
+    help="Number of files to compress in parallel, with --raw-zip.  Defaults to the number of CPUs."
+)
+group.add_argument(
+    '--precompile', action='store_const', const=True, default=False, dest='precompile',
+    help="Include normal and optimized bytecode for the latci package, compiled by the --python interpreter."
+)
+group.add_argument(
+    '--wheelhouse', action='store_const', const=True, default=False, dest='wheelhouse',
+    help=(
+        "Include wheels for all requirements, built by the --python interpreter, and install from them at deploy time."
+        "  Build on a platform matching the deployment target."
+    )
+)
+group.add_argument(
+    '--python', nargs=1, metavar='PYTHON', dest='python',
+    help="Interpreter matching the deployment target, for --precompile and --wheelhouse.  Defaults to this one."
+)
 group = parser.add_argument_group(title='Settings for use with --deploy and --configure')
 group.add_argument(
     '-e, --environment', nargs=1, metavar='ENVIRONMENT', dest='environment',
@@ -329,7 +838,11 @@ if 'deploy' in args.actions:
         args.actions.add('build')
 
 if 'build' in args.actions:
-    cmd_build(args.artifact, args.server_ini[0], verbose=args.list_files)
+    cmd_build(
+        args.artifact, args.server_ini[0], verbose=args.list_files, fingerprint=args.fingerprint, bundle=args.bundle,
+        precompile=args.precompile, wheelhouse=args.wheelhouse, python=args.python[0] if args.python else None,
+        incremental=args.incremental, jobs=args.jobs[0] if args.jobs else None, raw_zip=args.raw_zip
+    )
 
 if 'deploy' in args.actions:
     cmd_deploy(args.eb, args.environment, args.label, args.message)
@@ -0,0 +1,104 @@
+-- Compares the old row-level attendance history trigger with the statement-level one in schema.sql on bulk updates.
+--
+-- Usage: psql -f db/benchmarks/attendance_history_trigger.sql
+--
+-- Everything is created in a scratch schema inside a transaction that is rolled back at the end, so this is safe to
+-- run against any database.  Tables are not partitioned, to isolate the cost of the triggers themselves.
+BEGIN;
+CREATE SCHEMA history_trigger_benchmark;
+SET LOCAL search_path=history_trigger_benchmark;
+
+
+CREATE TABLE attendance (
+	student_id INT NOT NULL,
+	activity_id INT NOT NULL,
+	date DATE NOT NULL,
+	status_id INT NOT NULL,
+	comment TEXT NULL,
+	date_entered TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+	PRIMARY KEY(student_id, activity_id, date)
+);
+
+CREATE TABLE attendance_history (
+	id SERIAL NOT NULL,
+	student_id INT NOT NULL,
+	activity_id INT NOT NULL,
+	date DATE NOT NULL,
+	status_id INT NOT NULL,
+	comment TEXT NULL,
+	date_entered TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+	PRIMARY KEY(id)
+);
+
+-- The previous FOR EACH ROW implementation.
+CREATE FUNCTION row_tproc()
+RETURNS TRIGGER
+LANGUAGE PLPGSQL
+AS $PROC$
+BEGIN
+	IF TG_OP='UPDATE' THEN
+		IF ROW(NEW.*) IS NOT DISTINCT FROM ROW(OLD.*) THEN
+			RETURN NEW;
+		END IF;
+	END IF;
+	INSERT INTO attendance_history (student_id, activity_id, date, status_id, comment, date_entered)
+	VALUES (OLD.student_id, OLD.activity_id, OLD.date, OLD.status_id, OLD.comment, OLD.date_entered);
+	RETURN NEW;
+END
+$PROC$;
+
+-- The FOR EACH STATEMENT implementation, minus partition creation.
+CREATE FUNCTION statement_tproc()
+RETURNS TRIGGER
+LANGUAGE PLPGSQL
+AS $PROC$
+BEGIN
+	INSERT INTO attendance_history (student_id, activity_id, date, status_id, comment, date_entered)
+	SELECT o.student_id, o.activity_id, o.date, o.status_id, o.comment, o.date_entered
+	FROM old_rows AS o LEFT JOIN new_rows AS n USING (student_id, activity_id, date)
+	WHERE ROW(o.*) IS DISTINCT FROM ROW(n.*);
+	RETURN NULL;
+END
+$PROC$;
+
+-- One class of 500 students on a single day.
+INSERT INTO attendance (student_id, activity_id, date, status_id)
+SELECT student_id, 1, '2015-10-01', 1 FROM generate_series(1, 500) AS student_id;
+
+
+CREATE FUNCTION run_benchmark(label TEXT, iterations INT)
+RETURNS VOID
+LANGUAGE PLPGSQL
+AS $PROC$
+DECLARE
+	started TIMESTAMP WITH TIME ZONE;
+	elapsed INTERVAL;
+BEGIN
+	TRUNCATE attendance_history;
+	started := clock_timestamp();
+	FOR i IN 1..iterations LOOP
+		-- Every row changes...
+		UPDATE attendance SET status_id=status_id % 3 + 1 WHERE activity_id=1 AND date='2015-10-01';
+		-- ...and then nothing changes, exercising the "skip if unchanged" path.
+		UPDATE attendance SET status_id=status_id WHERE activity_id=1 AND date='2015-10-01';
+	END LOOP;
+	elapsed := clock_timestamp() - started;
+	RAISE NOTICE '%: % ms per pair of 500-row updates (% history rows written)',
+		label,
+		round((EXTRACT(EPOCH FROM elapsed) * 1000 / iterations)::NUMERIC, 2),
+		(SELECT COUNT(*) FROM attendance_history);
+END
+$PROC$;
+
+
+CREATE TRIGGER history AFTER UPDATE ON attendance FOR EACH ROW EXECUTE PROCEDURE row_tproc();
+SELECT run_benchmark('FOR EACH ROW', 50);
+DROP TRIGGER history ON attendance;
+
+CREATE TRIGGER history AFTER UPDATE ON attendance
+	REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+	FOR EACH STATEMENT EXECUTE PROCEDURE statement_tproc();
+SELECT run_benchmark('FOR EACH STATEMENT', 50);
+DROP TRIGGER history ON attendance;
+
+ROLLBACK;
@@ -11,9 +11,12 @@ CREATE TABLE student (
 
 	date_inactive TIMESTAMP WITH TIME ZONE NULL,  -- if non-NULL, this student is "deleted"; date is for future use in case we want to purge records from X years ago.
 	date_created TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+	modseq BIGINT NOT NULL DEFAULT 0,  -- Modification sequence, set by modseq_tproc().  See "Delta sync" below.
 	PRIMARY KEY(id)
 );
-CREATE INDEX ON student(name_first, name_last);
+-- Only active rows are indexed for name lookups; queries that include inactive rows are rare.
+CREATE INDEX ON student(name_first, name_last) WHERE date_inactive IS NULL;
+CREATE INDEX ON student(modseq);
 
 
 CREATE TABLE staff (
@@ -23,6 +26,7 @@ CREATE TABLE staff (
 
 	date_inactive TIMESTAMP WITH TIME ZONE NULL,  -- if non-NULL, this student is "deleted"; date is for future use in case we want to purge records from X years ago.
 	date_created TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+	modseq BIGINT NOT NULL DEFAULT 0,  -- Modification sequence, set by modseq_tproc().  See "Delta sync" below.
 
 	can_login BOOLEAN NOT NULL DEFAULT TRUE,	-- Don't allow teachers without this to login
 	email VARCHAR NULL,
@@ -36,8 +40,9 @@ CREATE TABLE staff (
 	PRIMARY KEY(id),
 	UNIQUE(email)
 );
-CREATE INDEX ON staff(name_first, name_last);
+CREATE INDEX ON staff(name_first, name_last) WHERE date_inactive IS NULL;
 CREATE INDEX ON staff(email);
+CREATE INDEX ON staff(modseq);
 
 
 CREATE TABLE location (
@@ -104,6 +109,7 @@ CREATE TABLE activity (  -- Sometimes also called a "Roster"
 	
 	date_inactive TIMESTAMP WITH TIME ZONE NULL,  -- if non-NULL, this activity is "deleted"; date is for future use in case we want to purge records from X years ago.
 	date_created TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+	modseq BIGINT NOT NULL DEFAULT 0,  -- Modification sequence, set by modseq_tproc().  See "Delta sync" below.
 
 	PRIMARY KEY(id),
 	FOREIGN KEY(staff_id) REFERENCES staff(id) ON UPDATE CASCADE ON DELETE RESTRICT,
@@ -114,6 +120,9 @@ CREATE TABLE activity (  -- Sometimes also called a "Roster"
 CREATE INDEX ON activity(staff_id);
 CREATE INDEX ON activity(location_id);
 CREATE INDEX ON activity(category_id);
+CREATE INDEX ON activity(start_date, end_date) WHERE date_inactive IS NULL;
+CREATE INDEX ON activity(name) WHERE date_inactive IS NULL;
+CREATE INDEX ON activity(modseq);
 
 
 
@@ -136,6 +145,67 @@ CREATE INDEX ON activity_enrollment(student_id);
 
 
 
+-- Helpers for tables that are range-partitioned by month on their "date" column (requires PostgreSQL 11 or later).
+-- Partitions are named <parent>_YYYY_MM, and created ahead of time by maintenance rather than as rows arrive.  Rows for
+-- months without a partition go to the DEFAULT partition, <parent>_default.
+CREATE OR REPLACE FUNCTION create_month_partition(parent TEXT, for_date DATE)
+RETURNS TEXT
+SECURITY INVOKER
+VOLATILE
+LANGUAGE PLPGSQL
+AS $PROC$
+DECLARE
+	month_start DATE := date_trunc('month', for_date)::DATE;
+	month_end DATE := (date_trunc('month', for_date) + INTERVAL '1 month')::DATE;
+	partition_name TEXT := parent || '_' || to_char(for_date, 'YYYY_MM');
+	default_name TEXT := parent || '_default';
+BEGIN
+	-- Creates the partition of parent covering for_date if it does not already exist, and returns its name.
+	IF to_regclass(partition_name) IS NULL THEN
+		BEGIN
+			IF to_regclass(default_name) IS NULL THEN
+				EXECUTE format(
+					'CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+					partition_name, parent, month_start, month_end
+				);
+			ELSE
+				-- The month's rows may already be in the DEFAULT partition, which would keep it from being created
+				-- outright.  Move them to a new table and attach that instead, blocking writes to the DEFAULT partition
+				-- (but not reads) meanwhile.
+				EXECUTE format('LOCK TABLE %I IN EXCLUSIVE MODE', default_name);
+				EXECUTE format('CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS INCLUDING CONSTRAINTS)', partition_name, parent);
+				EXECUTE format(
+					'WITH moved AS (DELETE FROM %I WHERE date >= %L AND date < %L RETURNING *) INSERT INTO %I SELECT * FROM moved',
+					default_name, month_start, month_end, partition_name
+				);
+				EXECUTE format(
+					'ALTER TABLE %I ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+					parent, partition_name, month_start, month_end
+				);
+			END IF;
+		EXCEPTION WHEN duplicate_table OR unique_violation THEN
+			-- Created by a concurrent transaction.
+		END;
+	END IF;
+	RETURN partition_name;
+END;
+$PROC$;
+
+CREATE OR REPLACE FUNCTION month_partitions(parent TEXT)
+RETURNS TABLE(partition_name TEXT, month_start DATE)
+SECURITY INVOKER
+STABLE
+LANGUAGE SQL
+AS $PROC$
+	-- Lists the monthly partitions of parent, oldest first.  The DEFAULT partition is not included.
+	SELECT c.relname::TEXT, to_date(right(c.relname, 7), 'YYYY_MM')
+	FROM pg_inherits AS i INNER JOIN pg_class AS c ON c.oid=i.inhrelid
+	WHERE i.inhparent=parent::REGCLASS AND c.relname ~ '_[0-9]{4}_[0-9]{2}$'
+	ORDER BY 2;
+$PROC$;
+
+
+
 CREATE TABLE attendance ( -- aka "Checkin"
 	-- NOTE: This system does not currently handle any notion of multiple checkins in a particular class per day
 	-- This may or may not matter, we should discuss this.
@@ -159,10 +229,57 @@ CREATE TABLE attendance ( -- aka "Checkin"
 	status_id INT NOT NULL,
 	comment TEXT NULL, -- Optional
 	date_entered TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+	--
+	-- Partitioned by month of the attendance date, so lookups for a particular day only touch that month's partition.
+	-- attendance_maintain_partitions() creates upcoming partitions ahead of time and detaches expired ones.  Dates
+	-- outside of them land in attendance_default until maintenance creates their month.
 	PRIMARY KEY(student_id, activity_id, date),
 	FOREIGN KEY(student_id) REFERENCES student(id) ON UPDATE CASCADE ON DELETE CASCADE,
 	FOREIGN KEY(activity_id) REFERENCES activity(id) ON UPDATE CASCADE ON DELETE CASCADE
-);
+) PARTITION BY RANGE (date);
+CREATE INDEX ON attendance(activity_id, date);
+CREATE TABLE attendance_default PARTITION OF attendance DEFAULT;
+
+CREATE OR REPLACE FUNCTION attendance_maintain_partitions(months_ahead INT, detach_after INTERVAL)
+RETURNS TABLE(partition_name TEXT, action TEXT)
+SECURITY INVOKER
+VOLATILE
+LANGUAGE PLPGSQL
+AS $PROC$
+DECLARE
+	rec RECORD;
+BEGIN
+	-- Creates attendance and attendance_history partitions for the current month and the next months_ahead months, and
+	-- for any other months that have rows in their DEFAULT partitions.  Partitions entirely older than detach_after (if
+	-- not NULL) are detached from attendance, but kept as standalone tables.
+	FOR rec IN
+		SELECT p.parent, m.first_day::DATE AS first_day
+		FROM (VALUES ('attendance'), ('attendance_history')) AS p(parent)
+		CROSS JOIN generate_series(date_trunc('month', NOW()), date_trunc('month', NOW()) + months_ahead * INTERVAL '1 month', INTERVAL '1 month') AS m(first_day)
+		UNION SELECT 'attendance', date_trunc('month', d.date)::DATE FROM attendance_default AS d
+		UNION SELECT 'attendance_history', date_trunc('month', d.date)::DATE FROM attendance_history_default AS d
+		ORDER BY 1, 2
+	LOOP
+		IF to_regclass(rec.parent || '_' || to_char(rec.first_day, 'YYYY_MM')) IS NULL THEN
+			partition_name := create_month_partition(rec.parent, rec.first_day);
+			action := 'created';
+			RETURN NEXT;
+		END IF;
+	END LOOP;
+
+	IF detach_after IS NULL THEN
+		RETURN;
+	END IF;
+	FOR rec IN SELECT * FROM month_partitions('attendance') AS p LOOP
+		IF (rec.month_start + INTERVAL '1 month') <= NOW() - detach_after THEN
+			EXECUTE format('ALTER TABLE attendance DETACH PARTITION %I', rec.partition_name);
+			partition_name := rec.partition_name;
+			action := 'detached';
+			RETURN NEXT;
+		END IF;
+	END LOOP;
+END;
+$PROC$;
 
 CREATE VIEW attendance_upsert AS SELECT * FROM attendance;
 CREATE OR REPLACE FUNCTION attendance_upsert_tproc()
@@ -204,6 +321,9 @@ CREATE TRIGGER attendance_upsert_insert INSTEAD OF INSERT ON attendance_upsert F
 
 CREATE TABLE attendance_history (
 	-- Archive of past attendance data for future development/reporting.
+	-- Partitioned by month of the attendance date.  Partitions are created along with attendance's by
+	-- attendance_maintain_partitions(), and compacted or dropped by attendance_history_maintain().  Dates outside of them
+	-- land in attendance_history_default.
 	id SERIAL NOT NULL,
 	student_id INT NOT NULL,
 	activity_id INT NOT NULL,
@@ -211,10 +331,53 @@ CREATE TABLE attendance_history (
 	status_id INT NOT NULL,
 	comment TEXT NULL, -- Optional
 	date_entered TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
-	PRIMARY KEY(id),
+	PRIMARY KEY(id, date),
 	FOREIGN KEY(student_id) REFERENCES student(id) ON UPDATE CASCADE ON DELETE CASCADE,
 	FOREIGN KEY(activity_id) REFERENCES activity(id) ON UPDATE CASCADE ON DELETE CASCADE
-);
+) PARTITION BY RANGE (date);
+CREATE INDEX ON attendance_history(student_id, activity_id, date);
+CREATE INDEX ON attendance_history(activity_id, date);
+CREATE TABLE attendance_history_default PARTITION OF attendance_history DEFAULT;
+
+CREATE OR REPLACE FUNCTION attendance_history_maintain(compact_after INTERVAL, drop_after INTERVAL)
+RETURNS TABLE(partition_name TEXT, action TEXT)
+SECURITY INVOKER
+VOLATILE
+LANGUAGE PLPGSQL
+AS $PROC$
+DECLARE
+	rec RECORD;
+	month_end DATE;
+	affected BIGINT;
+BEGIN
+	-- Applies the attendance_history retention policy.  Partitions entirely older than drop_after are dropped.
+	-- Partitions entirely older than compact_after are compacted down to the most recent history entry for each
+	-- attendance record.  Either may be NULL to skip that step.
+	FOR rec IN SELECT * FROM month_partitions('attendance_history') AS p LOOP
+		month_end := (rec.month_start + INTERVAL '1 month')::DATE;
+		partition_name := rec.partition_name;
+		IF drop_after IS NOT NULL AND month_end <= NOW() - drop_after THEN
+			EXECUTE format('ALTER TABLE attendance_history DETACH PARTITION %I', rec.partition_name);
+			EXECUTE format('DROP TABLE %I', rec.partition_name);
+			action := 'dropped';
+			RETURN NEXT;
+		ELSIF compact_after IS NOT NULL AND month_end <= NOW() - compact_after THEN
+			EXECUTE format(
+				'DELETE FROM %I AS h WHERE EXISTS('
+				'SELECT 1 FROM %I AS newer WHERE newer.student_id=h.student_id AND newer.activity_id=h.activity_id'
+				' AND newer.date=h.date AND newer.id>h.id)',
+				rec.partition_name, rec.partition_name
+			);
+			GET DIAGNOSTICS affected = ROW_COUNT;
+			IF affected > 0 THEN
+				action := 'compacted ' || affected || ' row(s)';
+				RETURN NEXT;
+			END IF;
+		END IF;
+	END LOOP;
+END;
+$PROC$;
+
 CREATE OR REPLACE FUNCTION attendance_maintain_history_tproc()
 RETURNS TRIGGER
 SECURITY INVOKER
@@ -222,21 +385,224 @@ VOLATILE
 LANGUAGE PLPGSQL
 AS $PROC$
 BEGIN
-	IF TG_OP='UPDATE' THEN
-		IF ROW(NEW.*) IS NOT DISTINCT FROM ROW(OLD.*) THEN
-			RETURN NEW;	-- Nothing changed!
-		END IF;
+	-- Rows being moved to the archive by archive_inactive() aren't changes, and their history is moved with them.
+	IF current_setting('latci.archiving', TRUE) = 'on' THEN
+		RETURN NULL;
 	END IF;
-	
-	INSERT INTO attendance_history (student_id, activity_id, date, status_id, comment, date_entered)
-	VALUES (OLD.student_id, OLD.activity_id, OLD.date, OLD.status_id, OLD.comment, OLD.date_entered);
+	-- Statement-level trigger: old_rows (and for updates, new_rows) are transition tables holding every affected row,
+	-- so a bulk change writes all of its history with a single INSERT.
 	IF TG_OP='UPDATE' THEN
+		INSERT INTO attendance_history (student_id, activity_id, date, status_id, comment, date_entered)
+		SELECT o.student_id, o.activity_id, o.date, o.status_id, o.comment, o.date_entered
+		FROM old_rows AS o LEFT JOIN new_rows AS n USING (student_id, activity_id, date)
+		WHERE ROW(o.*) IS DISTINCT FROM ROW(n.*);	-- Skip rows where nothing changed!
+	ELSE
+		INSERT INTO attendance_history (student_id, activity_id, date, status_id, comment, date_entered)
+		SELECT o.student_id, o.activity_id, o.date, o.status_id, o.comment, o.date_entered
+		FROM old_rows AS o;
+	END IF;
+	RETURN NULL;
+END
+$PROC$;
+-- Transition tables can only be used by triggers on a single event, hence two triggers.
+CREATE TRIGGER attendance_maintain_history_update AFTER UPDATE ON attendance
+	REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+	FOR EACH STATEMENT EXECUTE PROCEDURE attendance_maintain_history_tproc();
+CREATE TRIGGER attendance_maintain_history_delete AFTER DELETE ON attendance
+	REFERENCING OLD TABLE AS old_rows
+	FOR EACH STATEMENT EXECUTE PROCEDURE attendance_maintain_history_tproc();
+
+
+
+-- Change notifications.  Every change to attendance and activity_enrollment sends a compact JSON description of the row
+-- on the 'latci_changes' channel, which the backend relays to clients of its change feed (see latci.changes).  Notices
+-- are only delivered when (and if) the transaction commits.  The trigger arguments name columns to leave out of the
+-- payload, which must stay under PostgreSQL's 8000 byte limit.
+CREATE OR REPLACE FUNCTION notify_change_tproc()
+RETURNS TRIGGER
+SECURITY INVOKER
+VOLATILE
+LANGUAGE PLPGSQL
+AS $PROC$
+BEGIN
+	IF current_setting('latci.archiving', TRUE) = 'on' THEN
+		RETURN NULL;  -- See archive_inactive()
+	END IF;
+	IF TG_OP='DELETE' THEN
+		PERFORM pg_notify('latci_changes', jsonb_build_object(
+			'table', TG_TABLE_NAME, 'op', lower(TG_OP), 'row', to_jsonb(o) - COALESCE(TG_ARGV, '{}')
+		)::TEXT)
+		FROM old_rows AS o;
+	ELSE
+		PERFORM pg_notify('latci_changes', jsonb_build_object(
+			'table', TG_TABLE_NAME, 'op', lower(TG_OP), 'row', to_jsonb(n) - COALESCE(TG_ARGV, '{}')
+		)::TEXT)
+		FROM new_rows AS n;
+	END IF;
+	RETURN NULL;
+END
+$PROC$;
+CREATE TRIGGER attendance_notify_insert AFTER INSERT ON attendance
+	REFERENCING NEW TABLE AS new_rows
+	FOR EACH STATEMENT EXECUTE PROCEDURE notify_change_tproc('comment', 'date_entered');
+CREATE TRIGGER attendance_notify_update AFTER UPDATE ON attendance
+	REFERENCING NEW TABLE AS new_rows
+	FOR EACH STATEMENT EXECUTE PROCEDURE notify_change_tproc('comment', 'date_entered');
+CREATE TRIGGER attendance_notify_delete AFTER DELETE ON attendance
+	REFERENCING OLD TABLE AS old_rows
+	FOR EACH STATEMENT EXECUTE PROCEDURE notify_change_tproc('comment', 'date_entered');
+CREATE TRIGGER activity_enrollment_notify_insert AFTER INSERT ON activity_enrollment
+	REFERENCING NEW TABLE AS new_rows
+	FOR EACH STATEMENT EXECUTE PROCEDURE notify_change_tproc();
+CREATE TRIGGER activity_enrollment_notify_update AFTER UPDATE ON activity_enrollment
+	REFERENCING NEW TABLE AS new_rows
+	FOR EACH STATEMENT EXECUTE PROCEDURE notify_change_tproc();
+CREATE TRIGGER activity_enrollment_notify_delete AFTER DELETE ON activity_enrollment
+	REFERENCING OLD TABLE AS old_rows
+	FOR EACH STATEMENT EXECUTE PROCEDURE notify_change_tproc();
+
+
+
+-- Delta sync.  Students, staff and activities carry a modification sequence (modseq), which is set to the ID of the
+-- writing transaction whenever a row is inserted or changed.  Transaction IDs only increase, but transactions don't
+-- necessarily commit in order, so clients sync against txid_snapshot_xmin(txid_current_snapshot()): every transaction
+-- below it has finished, so no row with a lower modseq can still appear.  See latci.api.rest.DeltaSyncRESTController.
+CREATE OR REPLACE FUNCTION modseq_tproc()
+RETURNS TRIGGER
+SECURITY INVOKER
+VOLATILE
+LANGUAGE PLPGSQL
+AS $PROC$
+BEGIN
+	IF TG_OP='UPDATE' AND NEW IS NOT DISTINCT FROM OLD THEN
 		RETURN NEW;
 	END IF;
-	RETURN OLD;
+	NEW.modseq := txid_current();
+	RETURN NEW;
 END
 $PROC$;
-CREATE TRIGGER attendance_maintain_history AFTER UPDATE OR DELETE ON attendance FOR EACH ROW EXECUTE PROCEDURE attendance_maintain_history_tproc();
+CREATE TRIGGER student_modseq BEFORE INSERT OR UPDATE ON student FOR EACH ROW EXECUTE PROCEDURE modseq_tproc();
+CREATE TRIGGER staff_modseq BEFORE INSERT OR UPDATE ON staff FOR EACH ROW EXECUTE PROCEDURE modseq_tproc();
+CREATE TRIGGER activity_modseq BEFORE INSERT OR UPDATE ON activity FOR EACH ROW EXECUTE PROCEDURE modseq_tproc();
+
+
+
+-- Archive tables.  Rows that have been inactive for a long time are moved here by archive_inactive() to keep the
+-- active tables (and their indexes) small.  These deliberately have no foreign keys, since the rows they would
+-- reference may be archived too.
+CREATE TABLE student_archive (
+	LIKE student,
+	date_archived TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+	PRIMARY KEY(id)
+);
+
+CREATE TABLE staff_archive (
+	LIKE staff,
+	date_archived TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+	PRIMARY KEY(id)
+);
+
+CREATE TABLE activity_archive (
+	LIKE activity,
+	date_archived TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+	PRIMARY KEY(id)
+);
+
+CREATE TABLE activity_enrollment_archive (
+	LIKE activity_enrollment,
+	date_archived TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+	PRIMARY KEY(id)
+);
+CREATE INDEX ON student_archive(modseq);
+CREATE INDEX ON staff_archive(modseq);
+CREATE INDEX ON activity_archive(modseq);
+CREATE INDEX ON activity_enrollment_archive(activity_id);
+CREATE INDEX ON activity_enrollment_archive(student_id);
+
+CREATE TABLE attendance_archive (
+	LIKE attendance,
+	date_archived TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+	PRIMARY KEY(student_id, activity_id, date)
+);
+CREATE INDEX ON attendance_archive(activity_id, date);
+
+CREATE TABLE attendance_history_archive (
+	LIKE attendance_history,
+	date_archived TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+	PRIMARY KEY(id)
+);
+CREATE INDEX ON attendance_history_archive(student_id, activity_id, date);
+CREATE INDEX ON attendance_history_archive(activity_id, date);
+
+CREATE OR REPLACE FUNCTION archive_inactive(max_age INTERVAL)
+RETURNS TABLE(archived_table TEXT, archived_rows BIGINT)
+SECURITY INVOKER
+VOLATILE
+LANGUAGE PLPGSQL
+AS $PROC$
+DECLARE
+	cutoff TIMESTAMP WITH TIME ZONE := NOW() - max_age;
+	activity_ids INT[];
+	student_ids INT[];
+BEGIN
+	-- Moves students, staff and activities that have been inactive for longer than max_age to their archive tables.
+	-- Their attendance, attendance history and enrollments are archived alongside them (including attendance in
+	-- activities that are still active, for archived students), so nothing is lost to ON DELETE CASCADE.  Only staff
+	-- who still have activities are left alone, since activity.staff_id can't be left dangling.
+	SELECT ARRAY(SELECT act.id FROM activity AS act WHERE act.date_inactive < cutoff) INTO activity_ids;
+	SELECT ARRAY(SELECT s.id FROM student AS s WHERE s.date_inactive < cutoff) INTO student_ids;
+
+	-- Keeps the history and change notification triggers from treating the moves as deletions.
+	PERFORM set_config('latci.archiving', 'on', TRUE);
+
+	WITH moved AS (
+		DELETE FROM attendance WHERE activity_id=ANY(activity_ids) OR student_id=ANY(student_ids) RETURNING *
+	) INSERT INTO attendance_archive SELECT * FROM moved;
+	GET DIAGNOSTICS archived_rows = ROW_COUNT;
+	archived_table := 'attendance';
+	RETURN NEXT;
+
+	WITH moved AS (
+		DELETE FROM attendance_history WHERE activity_id=ANY(activity_ids) OR student_id=ANY(student_ids) RETURNING *
+	) INSERT INTO attendance_history_archive SELECT * FROM moved;
+	GET DIAGNOSTICS archived_rows = ROW_COUNT;
+	archived_table := 'attendance_history';
+	RETURN NEXT;
+
+	WITH moved AS (
+		DELETE FROM activity_enrollment WHERE activity_id=ANY(activity_ids) OR student_id=ANY(student_ids) RETURNING *
+	) INSERT INTO activity_enrollment_archive SELECT * FROM moved;
+	GET DIAGNOSTICS archived_rows = ROW_COUNT;
+	archived_table := 'activity_enrollment';
+	RETURN NEXT;
+
+	WITH moved AS (
+		DELETE FROM activity WHERE id=ANY(activity_ids) RETURNING *
+	) INSERT INTO activity_archive SELECT * FROM moved;
+	GET DIAGNOSTICS archived_rows = ROW_COUNT;
+	archived_table := 'activity';
+	RETURN NEXT;
+
+	WITH moved AS (
+		DELETE FROM student WHERE id=ANY(student_ids) RETURNING *
+	) INSERT INTO student_archive SELECT * FROM moved;
+	GET DIAGNOSTICS archived_rows = ROW_COUNT;
+	archived_table := 'student';
+	RETURN NEXT;
+
+	-- Staff go last, so that staff whose only activities were just archived are eligible.
+	WITH moved AS (
+		DELETE FROM staff AS t
+		WHERE t.date_inactive < cutoff AND NOT EXISTS(SELECT 1 FROM activity AS act WHERE act.staff_id=t.id)
+		RETURNING t.*
+	) INSERT INTO staff_archive SELECT * FROM moved;
+	GET DIAGNOSTICS archived_rows = ROW_COUNT;
+	archived_table := 'staff';
+	RETURN NEXT;
+
+	PERFORM set_config('latci.archiving', 'off', TRUE);
+END;
+$PROC$;
 
 
 
@@ -0,0 +1,69 @@
+-- Checks that archive_inactive() archives long-inactive students, staff and activities that have attendance and
+-- attendance history, and that their attendance and history are moved to the archive with them.
+--
+-- Usage: psql -v ON_ERROR_STOP=1 -f db/tests/archive_inactive.sql
+--
+-- Runs against a database set up with schema.sql, inside a transaction that is rolled back at the end, so it leaves no
+-- trace.  A failed check raises an assertion error; success prints a notice.
+BEGIN;
+SET LOCAL search_path=listenandtalk,public;
+
+DO $TEST$
+DECLARE
+	status INT;
+	loc INT;
+	cat INT;
+	old_staff INT;
+	old_activity INT;
+	old_student INT;
+	current_student INT;
+BEGIN
+	INSERT INTO attendance_status (name) VALUES ('Archive test') RETURNING id INTO status;
+	INSERT INTO location (name) VALUES ('Archive test') RETURNING id INTO loc;
+	INSERT INTO category (name) VALUES ('Archive test') RETURNING id INTO cat;
+
+	-- A staff member and their only activity, both inactive for three years.
+	INSERT INTO staff (name_first, name_last, date_inactive)
+	VALUES ('Former', 'Teacher', NOW() - INTERVAL '3 years') RETURNING id INTO old_staff;
+	INSERT INTO activity (name, staff_id, location_id, category_id, start_date, end_date, date_inactive)
+	VALUES ('Former class', old_staff, loc, cat, '2015-09-01', '2016-06-30', NOW() - INTERVAL '3 years')
+	RETURNING id INTO old_activity;
+
+	-- Two students who attended it: one still active, one inactive for three years.
+	INSERT INTO student (name_first, name_last) VALUES ('Current', 'Student') RETURNING id INTO current_student;
+	INSERT INTO student (name_first, name_last, date_inactive)
+	VALUES ('Former', 'Student', NOW() - INTERVAL '3 years') RETURNING id INTO old_student;
+	INSERT INTO activity_enrollment (activity_id, student_id, start_date)
+	VALUES (old_activity, current_student, '2015-09-01'), (old_activity, old_student, '2015-09-01');
+
+	PERFORM create_month_partition('attendance', '2015-10-01');
+	INSERT INTO attendance (student_id, activity_id, date, status_id)
+	VALUES (current_student, old_activity, '2015-10-01', status), (old_student, old_activity, '2015-10-01', status);
+	UPDATE attendance SET comment='Late' WHERE activity_id=old_activity;  -- Writes history
+	ASSERT (SELECT COUNT(*) FROM attendance_history WHERE activity_id=old_activity) = 2, 'history was not written';
+
+	PERFORM archive_inactive(INTERVAL '730 days');
+
+	ASSERT NOT EXISTS(SELECT 1 FROM activity WHERE id=old_activity), 'activity with attendance was not archived';
+	ASSERT EXISTS(SELECT 1 FROM activity_archive WHERE id=old_activity), 'activity is missing from the archive';
+	ASSERT NOT EXISTS(SELECT 1 FROM student WHERE id=old_student), 'student with attendance was not archived';
+	ASSERT EXISTS(SELECT 1 FROM student_archive WHERE id=old_student), 'student is missing from the archive';
+	ASSERT NOT EXISTS(SELECT 1 FROM staff WHERE id=old_staff), 'staff whose activities were archived was not archived';
+	ASSERT EXISTS(SELECT 1 FROM staff_archive WHERE id=old_staff), 'staff is missing from the archive';
+	ASSERT EXISTS(SELECT 1 FROM student WHERE id=current_student), 'active student was archived';
+
+	ASSERT NOT EXISTS(SELECT 1 FROM attendance WHERE activity_id=old_activity), 'attendance was left behind';
+	ASSERT (SELECT COUNT(*) FROM attendance_archive WHERE activity_id=old_activity AND comment='Late') = 2,
+		'attendance is missing from the archive';
+	ASSERT NOT EXISTS(SELECT 1 FROM attendance_history WHERE activity_id=old_activity), 'history was left behind';
+	-- Exactly the two history rows written above: moving attendance must not record it as deleted.
+	ASSERT (SELECT COUNT(*) FROM attendance_history_archive WHERE activity_id=old_activity) = 2,
+		'history in the archive is wrong';
+	ASSERT (SELECT COUNT(*) FROM activity_enrollment_archive WHERE activity_id=old_activity) = 2,
+		'enrollments are missing from the archive';
+
+	RAISE NOTICE 'archive_inactive: OK';
+END
+$TEST$;
+
+ROLLBACK;
@@ -95,12 +95,38 @@ class DatabaseIntegrityViolation(ValidationError):
     text = 'The requested action violates database integrity constraints.'
 
 
+class BulkLimitError(APIError):
+    status = http.client.REQUEST_ENTITY_TOO_LARGE
+    name = 'bulk-limit-exceeded'
+    text = None
+    fmt = 'No more than {max} items may be processed at once.  Use bulk mode for larger requests.'
+
+
+class UnsupportedMediaTypeError(APIError):
+    status = http.client.UNSUPPORTED_MEDIA_TYPE
+    name = 'unsupported-media-type'
+    text = 'The request body is not in a supported format.'
+
+
+class PartialCommitError(APIError):
+    status = http.client.BAD_REQUEST
+    name = 'bulk-partially-committed'
+    text = None
+    fmt = '{committed} item(s) were committed before errors occurred.'
+
+
 class MissingKeyError(APIError):
     status = http.client.BAD_REQUEST
     name = 'key-required'
     text = 'Data element must have a key.'
 
 
+class InvalidKeyError(APIError):
+    status = http.client.BAD_REQUEST
+    name = 'key-invalid'
+    text = 'Key is not in the expected format.'
+
+
 class MissingValueError(APIError):
     status = http.client.BAD_REQUEST
     name = 'value-required'
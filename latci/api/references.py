@@ -2,13 +2,18 @@
 Manages references.
 """
 from abc import ABCMeta, abstractmethod
+import datetime
 import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+import latci.api.errors as err
 
 
 class AbstractReference(metaclass=ABCMeta):
     """
     Abstract reference base class.
     """
+    __slots__ = ()
     manager = None
 
     @abstractmethod
@@ -64,6 +69,20 @@ class AbstractReference(metaclass=ABCMeta):
         in refs"""
         pass
 
+    @classmethod
+    @abstractmethod
+    def template(cls):
+        """
+        Returns a reference whose SQL expressions use bound parameters rather than literal values.  Queries built
+        against it can be cached and reused for any reference by binding the values returned by to_params().
+        """
+        pass
+
+    @abstractmethod
+    def to_params(self):
+        """Returns the bound parameter values that make a template() reference's SQL expressions match this one."""
+        pass
+
     def to_url(self):
         """
         Returns the URL for this reference.
@@ -85,6 +104,9 @@ class ScalarReference(AbstractReference):
     """
     Refers to objects with a single 'value' attribute, as opposed to any composite form.
     """
+    # sql_in() matches sets larger than this by joining against the unnested array of values rather than with = ANY()
+    unnest_threshold = 1000
+
     def __init__(self, value):
         self.value = value
 
@@ -111,16 +133,34 @@ class ScalarReference(AbstractReference):
         """Returns an SQL Expression that evaluates to True if a database object equals this reference."""
         return getattr(self.manager.modelclass, self.manager.column) == self.value
 
+    @classmethod
+    def template(cls):
+        """Returns a reference whose SQL expressions use bound parameters rather than literal values."""
+        return cls(sa.bindparam('ref_value'))
+
+    def to_params(self):
+        """Returns the bound parameter values that make a template() reference's SQL expressions match this one."""
+        return {'ref_value': self.value}
+
     @classmethod
     def sql_in(cls, refs):
         """
         Returns an SQL Expression that evaluates to True if a database object equals any of the references included in
         in refs"""
         if not refs:
-            return sa.false
+            return sa.false()
         if len(refs) == 1:
             return refs[0].sql_equals()
-        return getattr(cls.manager.modelclass, cls.manager.column).in_(item.value for item in refs)
+
+        # Bind all of the values as a single array, so the statement is the same no matter how many references there
+        # are and never runs into limits on the number of parameters.
+        column = getattr(cls.manager.modelclass, cls.manager.column)
+        values = sa.bindparam(
+            'ref_values', [item.value for item in refs], type_=postgresql.ARRAY(column.type), unique=True
+        )
+        if len(refs) > cls.unnest_threshold:
+            return column.in_(sa.select([sa.func.unnest(values)]))
+        return column == sa.func.any(values)
 
 
 class ScalarReferenceManager:
@@ -146,7 +186,7 @@ class ScalarReferenceManager:
         self.makeurl = makeurl
         self.factory = type(typename + 'Reference', (ScalarReference,), {'manager': self})
 
-        for method in 'from_model', 'from_key', 'from_dict', 'sql_in':
+        for method in 'from_model', 'from_key', 'from_dict', 'sql_in', 'template':
             setattr(self, method, getattr(self.factory, method))
 
     @classmethod
@@ -161,3 +201,153 @@ class ScalarReferenceManager:
             controller.url_base + "/{}",
             *a, **kw
         )
+
+
+def _key_converter(column):
+    """
+    Returns a callable that converts a key component (possibly a string from a URL) to the Python type of column.
+    """
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        return lambda value: value
+
+    if python_type is datetime.date:
+        def convert(value):
+            if isinstance(value, datetime.date):
+                return value
+            return datetime.datetime.strptime(value, '%Y-%m-%d').date()
+        return convert
+    if python_type in (int, str):
+        return python_type
+    return lambda value: value
+
+
+class CompositeReference(AbstractReference):
+    """
+    Refers to objects with a key made up of multiple columns.
+
+    Keys are tuples with one value per column.  In URLs they are written as comma-separated values, e.g.
+    /api/v2/attendance/12,3,2015-10-01
+    """
+    __slots__ = ('values',)
+
+    def __init__(self, values):
+        self.values = values
+
+    @classmethod
+    def from_model(cls, model):
+        """Creates a reference from an SQLAlchemy model"""
+        return cls(tuple(getattr(model, column) for column in cls.manager.columns))
+
+    def to_model(self, model):
+        """Updates a model to match this reference"""
+        for column, value in zip(self.manager.columns, self.values):
+            setattr(model, column, value)
+        return model
+
+    @classmethod
+    def from_key(cls, key):
+        """Creates a reference from a key, which may be a sequence of values or a comma-separated string"""
+        if isinstance(key, str):
+            key = key.split(',')
+        converters = cls.manager.converters
+        if len(key) != len(converters):
+            raise err.InvalidKeyError()
+        try:
+            return cls(tuple(convert(value) for convert, value in zip(converters, key)))
+        except (TypeError, ValueError):
+            raise err.InvalidKeyError()
+
+    def to_key(self):
+        """Returns a key representing this reference"""
+        return self.values
+
+    def to_url(self):
+        """
+        Returns the URL for this reference.
+        """
+        makeurl = self.manager.makeurl
+        if callable(makeurl):
+            return makeurl(self.to_key())
+        return makeurl.format(*self.values)
+
+    def sql_equals(self):
+        """Returns an SQL Expression that evaluates to True if a database object equals this reference."""
+        return sa.and_(*(
+            getattr(self.manager.modelclass, column) == value
+            for column, value in zip(self.manager.columns, self.values)
+        ))
+
+    @classmethod
+    def template(cls):
+        """Returns a reference whose SQL expressions use bound parameters rather than literal values."""
+        return cls(tuple(sa.bindparam('ref_{}'.format(index)) for index in range(len(cls.manager.columns))))
+
+    def to_params(self):
+        """Returns the bound parameter values that make a template() reference's SQL expressions match this one."""
+        return {'ref_{}'.format(index): value for index, value in enumerate(self.values)}
+
+    @classmethod
+    def sql_in(cls, refs):
+        """
+        Returns an SQL Expression that evaluates to True if a database object equals any of the references included in
+        in refs"""
+        if not refs:
+            return sa.false()
+        if len(refs) == 1:
+            return refs[0].sql_equals()
+
+        # Bind one array per key column and compare the row value against their unnested rows, so the statement is the
+        # same no matter how many references there are and the composite key's index can be used.
+        mapper = sa.inspect(cls.manager.modelclass)
+        arrays = [
+            sa.bindparam(
+                'ref_values', [ref.values[index] for ref in refs],
+                type_=postgresql.ARRAY(mapper.columns[column].type), unique=True
+            )
+            for index, column in enumerate(cls.manager.columns)
+        ]
+        return sa.tuple_(*(getattr(cls.manager.modelclass, column) for column in cls.manager.columns)).in_(
+            sa.select([sa.func.unnest(array) for array in arrays])
+        )
+
+
+class CompositeReferenceManager:
+    """Handles references to objects with multi-column keys."""
+    def __init__(self, modelclass, typename, makeurl, columns=None):
+        """
+        Handles converting and generating reference objects.
+
+        :param modelclass: ORM Object Class
+        :param typename: Unique type name.
+        :param makeurl: URL format string with one {} per column, or callback
+        :param columns: Sequence of database column names.  Autodetected from the primary key if None.
+        """
+        mapper = sa.inspect(modelclass)
+        if columns is None:
+            pk = mapper.primary_key
+            if not pk or len(pk) < 2:
+                raise ValueError("Primary key must have at least 2 columns for this ReferenceManager.")
+            columns = [mapper.get_property_by_column(column).key for column in pk]
+
+        self.columns = tuple(columns)
+        self.converters = tuple(_key_converter(mapper.columns[column]) for column in self.columns)
+        self.modelclass = modelclass
+        self.typename = typename
+        self.makeurl = makeurl
+        self.factory = type(typename + 'Reference', (CompositeReference,), {'manager': self, '__slots__': ()})
+
+        for method in 'from_model', 'from_key', 'from_dict', 'sql_in', 'template':
+            setattr(self, method, getattr(self.factory, method))
+
+    @classmethod
+    def from_controller(cls, controller, *a, **kw):
+        modelclass = kw.pop('modelclass', controller.model)
+        typename = kw.pop('typename', controller.name)
+        columns = kw.pop('columns', None)
+        if columns is None:
+            columns = [column.key for column in sa.inspect(modelclass).primary_key]
+        makeurl = kw.pop('makeurl', controller.url_base + "/" + ",".join("{}" for _ in columns))
+
+        return cls(modelclass, typename, makeurl, columns, *a, **kw)
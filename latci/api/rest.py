@@ -1,18 +1,25 @@
 import collections.abc
 import http.client
 import functools
+import itertools
 
 import bottle
 from bottle import request, response
+import sqlalchemy as sa
 from sqlalchemy import orm, exc
+from sqlalchemy.ext import baked
 
 from latci.auth import auth_wrapper
 import latci.misc
+import latci.json
+import latci.database
+import latci.database.sql
 import latci.api.errors as err
 import collections
 from latci import config
 
 import datetime
+import time
 
 
 # Tracks a list of classes to initialize after creation.
@@ -59,6 +66,60 @@ def listify(obj):
     return obj if is_list(obj) else [obj]
 
 
+def chunked(iterable, size):
+    """
+    Splits an iterable into consecutive tuples of at most size items.
+
+    :param iterable: Input iterable
+    :param size: Maximum chunk size.  If None, the whole iterable is yielded as a single chunk, untouched.
+    :return: Generator of chunks
+    """
+    if not size:
+        yield iterable
+        return
+    iterator = iter(iterable)
+    while True:
+        chunk = tuple(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+# Cookie used to route a client's reads to the primary database shortly after it writes, so it sees its own changes
+# even if replicas are lagging.
+PIN_COOKIE = 'PinPrimaryUntil'
+
+
+def is_pinned_to_primary(req=None):
+    """
+    Returns True if the client wrote something recently enough that its reads should go to the primary database.
+
+    :param req: Request object, defaults to bottle.request if None
+    """
+    if req is None:
+        req = bottle.request
+    try:
+        return float(req.get_cookie(PIN_COOKIE, '0')) > time.time()
+    except ValueError:
+        return False
+
+
+def pin_to_primary(resp=None, seconds=None):
+    """
+    Pins the client to the primary database for a number of seconds.  Does nothing if no replicas are configured.
+
+    :param resp: Response object, defaults to bottle.response if None
+    :param seconds: Duration, defaults to config.REPLICA_PIN_SECONDS if None
+    """
+    if not latci.database.replica_engines:
+        return
+    if resp is None:
+        resp = bottle.response
+    if seconds is None:
+        seconds = config.REPLICA_PIN_SECONDS
+    resp.set_cookie(PIN_COOKIE, str(time.time() + seconds), max_age=seconds, path=config.API_PREFIX)
+
+
 class InstanceCache(collections.UserDict):
     """
     Subclass UserDict to provide a cache of loaded instances.
@@ -70,13 +131,13 @@ class InstanceCache(collections.UserDict):
         self.query_factory = query_factory
         self.reference_factory = reference_factory
 
-    def _key(self, item): return item if isinstance(item, str) else item.to_key()
+    def _key(self, item): return self._ref(item).to_key()
+
+    def _ref(self, item): return self.reference_factory.from_key(item) if isinstance(item, str) else item
 
     def __getitem__(self, item):
-        if isinstance(item, str):
-            key, ref = item, self.reference_factory.from_key(item)
-        else:
-            key, ref = item.to_key(), item
+        ref = self._ref(item)
+        key = ref.to_key()
         try:
             rv = super().__getitem__(key)
         except KeyError as ex:
@@ -168,7 +229,8 @@ class RESTController(metaclass=RESTMeta):
         automatically added.
     :cvar name: Name of this resource.  Used for error handling and URL generation.
     :cvar model: Corresponding SQLAlchemy model.
-    :cvar bulk_max: Maximum amount of entities allowed in a bulk operation.  None = no limit.
+    :cvar bulk_max: Maximum amount of entities allowed in a bulk operation.  None = no limit.  In bulk mode, this is
+        the chunk size instead.
     :cvar manager: ReferenceManager for this object.  Created by create_manager() if None.
     :cvar allow_delete: Allow instances to be deleted. Enables per-item DELETE.
     :cvar allow_delete_all: Allow the entire collection to be deleted. Requires allow_delete.
@@ -183,14 +245,22 @@ class RESTController(metaclass=RESTMeta):
     :cvar treat_put_as_patch: Treat PUT as PATCH if allow_replace is False.
     :cvar SchemaClass: Marshmallow Schema for process_in/process_out
 
-    :cvar defer: If True, the default implementation will defer process_out() calls on insertions and updates to allow
-        for the contents of the database to be refreshed in a more optimal fashion first.
+    :cvar defer: If True, the default implementation will defer process_out() calls on insertions and updates until
+        every affected instance has been re-read from the database by refresh().  Unnecessary for models whose
+        server-generated values are all fetched on flush (see latci.database.models.Model), which is why it defaults
+        to False.
 
     :ivar db: Database session
     :ivar method: Bottle request method being used.
     :ivar errors: List of accumulated errors.  If this list is not empty, dispatch() will return an appropriate error
         and rollback the transaction rather than allowing any modifications.
-    :ivar options: Dictionary of possible options.
+    :ivar options: Dictionary of possible options.  Common options include:
+        limit, offset: Paginate collection GETs.
+        count: On collection GETs, also return the total size of the collection as 'count'.  See count()
+        since: On collection GETs, only return changes made after a previously returned 'sequence'.  See
+            DeltaSyncRESTController
+        bulk: On collection POSTs and PATCHes, stream and process the body in chunks.  Must be set in the query
+            string.  See patch_bulk()
     :ivar auth: Authentication session information
     """
     url_prefix = config.API_PREFIX + 'v2/'
@@ -216,7 +286,13 @@ class RESTController(metaclass=RESTMeta):
 
     SchemaClass = None
 
-    defer = True
+    defer = False
+
+    # Chunk size for bulk mode if bulk_max is None.  See patch_bulk()
+    bulk_chunk_size = 500
+
+    # Cache of compiled single-instance queries, shared by all controllers.  See item_query()
+    bakery = baked.bakery()
 
     @classmethod
     def item_methods(cls):
@@ -254,7 +330,7 @@ class RESTController(metaclass=RESTMeta):
         :return: Adapted payload.  Or an exception...
         """
         payload = bottle.request.json
-        if method in ('GET', 'DELETE'):
+        if method in ('GET', 'HEAD', 'DELETE'):
             if payload is not None:
                 raise err.JSONValidationError('JSON Body is not expected here.')
             payload = {}
@@ -280,7 +356,7 @@ class RESTController(metaclass=RESTMeta):
         json = bottle.request.query.get('options', None)
         if json is not None:
             try:
-                query_options = latci.json.loads(options)
+                query_options = latci.json.loads(json)
             except Exception:
                 raise err.JSONValidationError("Error in parsing options parameter.")
             if not is_dict(query_options):
@@ -299,57 +375,121 @@ class RESTController(metaclass=RESTMeta):
         :param params: Route parameters dictionary.
         :return: Adapted data.  Or an exception
         """
-        if method in ('GET', 'DELETE'):
+        if method in ('GET', 'HEAD', 'DELETE'):
             return None if ref is None else ref.to_dict()
 
         data = payload.get('data')
         if not (is_dict(data) or (ref is None and is_list(data))):
             raise err.JSONValidationError("Data is in an invalid format.")
 
+        if is_list(data):
+            if cls.bulk_max is not None and len(data) > cls.bulk_max:
+                raise err.BulkLimitError(params={'max': cls.bulk_max})
+            return [cls.get_item(method, item, ref) for item in data]
+        return cls.get_item(method, data, ref)
+
+    @classmethod
+    def get_bulk_data(cls, method, ref, params):
+        """
+        Returns incoming data for a bulk request (one with the 'bulk' option set in the query string.)
+
+        The request body must be a JSON array of data items.  It is parsed incrementally, so the result is a lazy
+        iterator that validates and transforms each item as it is reached.
+        :param method: Request method.
+        :param ref: Instance reference.
+        :param params: Route parameters dictionary.
+        :return: Iterator of adapted data items.
+        """
+        if method not in ('POST', 'PATCH') or ref is not None:
+            raise err.JSONValidationError("Bulk mode is only available for POST and PATCH on collections.")
+
+        def _items():
+            try:
+                for item in latci.json.iter_array(bottle.request.body):
+                    yield cls.get_item(method, item, ref)
+            except ValueError as ex:
+                raise err.JSONValidationError("Error in parsing request body: {}".format(ex))
+        return _items()
+
+    @classmethod
+    def get_item(cls, method, item, ref):
+        """
+        Validates and transforms a single incoming data item.
+        :param method: Request method.
+        :param item: Data item.
+        :param ref: Instance reference.
+        :return: Adapted data item.  Or an exception
+        """
         if method == 'POST':
-            _transform = lambda _item, _name=cls.name: {
-                'value': _item,
-                'type': _name,
+            return {
+                'value': item,
+                'type': cls.name,
                 'key': None,
                 'ref': None
             }
-            if is_list(data):
-                return [_transform(item) for item in data]
-            else:
-                return _transform(data)
-
-        for item in listify(data):
-            if ref is not None:
-                item['ref'] = ref
-                if 'key' not in item:
-                    ref.to_dict(item)
-                elif ref != cls.manager.from_dict(item):
-                    raise err.JSONValidationError(
-                        "A key cannot be specified in this context unless it matches the context's key."
-                    )
+
+        if not is_dict(item):
+            raise err.JSONValidationError("Data is in an invalid format.")
+        if ref is not None:
+            item['ref'] = ref
+            if 'key' not in item:
+                ref.to_dict(item)
+            elif ref != cls.manager.from_dict(item):
+                raise err.JSONValidationError(
+                    "A key cannot be specified in this context unless it matches the context's key."
+                )
+        else:
+            # See if the item is valid.
+            if item.get('key') is None:
+                if not (method == 'PATCH' and cls.allow_patch_create and cls.allow_create):
+                    # Must have a key, unless we're patching and patch is allowed to create new items.
+                    raise err.MissingKeyError()
+                item['ref'] = None
             else:
-                # See if the item is valid.
-                if item.get('key') is None:
-                    if not (method == 'PATCH' and cls.allow_patch_create and cls.allow_create):
-                        # Must have a key, unless we're patching and patch is allowed to create new items.
-                        raise err.MissingKeyError()
-                    item['ref'] = None
-                else:
-                    item['ref'] = cls.manager.from_dict(item)
+                item['ref'] = cls.manager.from_dict(item)
 
-            value = item.setdefault('value', None)
-            if (
-                    not is_dict(value) and
-                    not (ref and value is None and method == 'PATCH' and cls.allow_patch_delete and cls.allow_delete)
-            ):
-                raise err.MissingValueError(item['ref'])
-        return data
+        value = item.setdefault('value', None)
+        if (
+                not is_dict(value) and
+                not (ref and value is None and method == 'PATCH' and cls.allow_patch_delete and cls.allow_delete)
+        ):
+            raise err.MissingValueError(item['ref'])
+        return item
 
     @classmethod
     def dispatch(cls, db=None, key=None, auth=None, **params):
         """
         Dispatches an incoming request.
 
+        Chooses which database session the request uses and then calls _dispatch().  GET and HEAD requests are served
+        from a read-only replica if any are configured, unless the client is pinned to the primary because it wrote
+        something recently.  Successful writes pin the client to the primary for config.REPLICA_PIN_SECONDS.
+
+        :param db: Database session (from Bottle)
+        :param auth: Authentication info (from Bottle)
+        :param params: Bottle route parameters
+        :return: Result of _dispatch()
+        """
+        bottle.request.environ['latci.controller'] = cls.__name__  # For logging
+        if bottle.request.method not in ('GET', 'HEAD'):
+            rv = cls._dispatch(db, key=key, auth=auth, **params)
+            if response.status_code < 400:
+                pin_to_primary()
+            return rv
+
+        replica = latci.database.session_for_read(primary=is_pinned_to_primary())
+        if replica is None:
+            return cls._dispatch(db, key=key, auth=auth, **params)
+        try:
+            return cls._dispatch(replica, key=key, auth=auth, **params)
+        finally:
+            replica.close()
+
+    @classmethod
+    def _dispatch(cls, db=None, key=None, auth=None, **params):
+        """
+        Handles an incoming request using the database session chosen by dispatch().
+
         Performs sanity checking on incoming data, creates an instance of this class, and then calls that instance.
 
         :param db: Database session (form Bottle)
@@ -382,9 +522,14 @@ class RESTController(metaclass=RESTMeta):
             ):
                 method = 'PATCH'
 
-            payload = cls.get_payload(method, ref, params)
-            options = cls.get_options(method, payload)
-            data = cls.get_data(method, payload, ref, params)
+            # Bulk mode is selected in the query string, since the body isn't parsed up front.
+            options = cls.get_options(method, {})
+            if options.get('bulk'):
+                data = cls.get_bulk_data(method, ref, params)
+            else:
+                payload = cls.get_payload(method, ref, params)
+                options = cls.get_options(method, payload)
+                data = cls.get_data(method, payload, ref, params)
 
             instance = cls(db, options, auth=auth, method=request.method, ref=ref, data=data, params=params)
             try:
@@ -447,7 +592,7 @@ class RESTController(metaclass=RESTMeta):
         self.params = params
         self.schema = self.get_schema()
         self.schema.session = self.db
-        self.cache = InstanceCache(query_factory=self.query, reference_factory=self.manager)
+        self.cache = InstanceCache(query_factory=self.item_query, reference_factory=self.manager)
 
     def get_schema(self):
         """
@@ -464,30 +609,72 @@ class RESTController(metaclass=RESTMeta):
         :param params: Route parameters.
         :return: JSON response
         """
-        if self.method in ('GET', 'HEAD'):
+        if self.method == 'GET':
             return self.get()
+        if self.method == 'HEAD':
+            return self.head()
         if self.method == 'DELETE':
             return self.delete()
         if self.method == 'PUT':
             return self.put()
         return self.patch()
 
-    def query(self, ref=None, from_refresh=False):
+    def base_query(self, session=None):
+        """
+        Returns the unfiltered query that query() builds upon.  Subclasses may override this to select from something
+        other than the model's table.
+
+        :param session: Session to build the query on.  Defaults to self.db
+        """
+        return (session or self.db).query(self.model)
+
+    def query(self, ref=None, from_refresh=False, session=None):
         """
         Builds an SQL Query, possibly limited to a single instance (or set of instances) of our object.
 
         :param ref: Primary key reference(s).
         :param from_refresh: True if this is originating from a refresh() operation, in which case certain filters
             should not be applied.
+        :param session: Session to build the query on.  Defaults to self.db
         :return: Query.
         """
-        query = self.db.query(self.model)
+        query = self.base_query(session)
         if is_list(ref):
             query = query.filter(self.manager.sql_in(ref))
         elif ref is not None:
             query = query.filter(ref.sql_equals())
         return query
 
+    def item_query(self, ref, for_get=False):
+        """
+        Returns a query for a single instance, using a cached copy of the compiled statement when possible.
+
+        The statement is built on the bakery's session by passing the manager's template() reference to query() (or
+        get_query() if for_get is True), then reused for every reference by binding its to_params().  It is cached per
+        controller class and query_cache_key(), so it must not depend on anything else.
+
+        :param ref: Primary key reference.
+        :param for_get: If True, uses get_query() rather than query().
+        :return: A baked query result, which supports one(), first(), all() and iteration.
+        """
+        def build(session):
+            template = self.manager.template()
+            query = self.query(template, session=session)
+            return self.get_query(template, query) if for_get else query
+
+        baked_query = self.bakery(build, type(self), for_get, self.query_cache_key())
+        return baked_query(self.db).params(**ref.to_params())
+
+    def query_cache_key(self):
+        """
+        Returns everything about this request that query() and get_query() depend on, as a hashable value.  Used by
+        item_query() to tell cached statements apart.
+
+        The default covers the request method and options.  Subclasses whose queries also depend on other request state
+        (such as params or auth) must extend it.
+        """
+        return self.method, latci.json.dumps(self.options, sort_keys=True)
+
     def get_query(self, ref=None, query=None):
         """
         Builds an modified SQL Query intended for use for GET requests only, which may include extraneous data that
@@ -518,19 +705,72 @@ class RESTController(metaclass=RESTMeta):
 
         return query
 
+    def count(self, mode=True, query=None):
+        """
+        Counts the results of a collection GET, ignoring any limit and offset.
+
+        Rows are counted exactly up to config.COUNT_EXACT_THRESHOLD.  Beyond that (or if mode is 'estimate'), the query
+        planner's row estimate is used instead.  The exact count never scans more than COUNT_EXACT_THRESHOLD + 1 rows,
+        so large collections are never fully scanned.
+
+        :param mode: Value of the 'count' option.  True for automatic selection, 'estimate' to only estimate.
+        :param query: Base query to count.  If None, calls self.query()
+        :return: Dictionary with 'value' and 'type' keys.  'type' is either 'exact' or 'estimate'.
+        """
+        if mode not in (True, 'estimate'):
+            raise err.JSONValidationError("Count option must be true or 'estimate'.")
+        if query is None:
+            query = self.query()
+        query = query.enable_eagerloads(False).order_by(None)
+
+        threshold = config.COUNT_EXACT_THRESHOLD
+        if mode is True and threshold > 0:
+            capped = query.limit(threshold + 1).subquery()
+            value = self.db.query(sa.func.count()).select_from(capped).scalar()
+            if value <= threshold:
+                return {'value': value, 'type': 'exact'}
+        return {'value': latci.database.sql.estimate_rows(self.db, query), 'type': 'estimate'}
+
     def get(self):
         """
         Called for GET requests.
         """
-        query = self.get_query(self.ref)
         if self.ref:
             try:
-                result = query.one()
+                result = self.item_query(self.ref, for_get=True).one()
             except orm.exc.NoResultFound:
                 raise err.NotFoundError(ref=self.ref)
             return {'data': self.process_out(result)}
+
+        query = self.get_query()
+        rv = {'data': [self.process_out(row) for row in query]}
+        count = self.options.get('count')
+        if count:
+            rv['count'] = self.count(count)
+        return rv
+
+    def head(self):
+        """
+        Called for HEAD requests.
+
+        Responds with the same status and content type get() would, but without loading or serializing any rows.  Items
+        are checked with a single EXISTS query.  Collections are only counted if the 'count' option asks for it, in
+        which case the result is reported in the X-Total-Count and X-Total-Count-Type headers (see count().)
+        """
+        response.content_type = 'application/json'
+        if self.ref:
+            if not self.db.query(self.query(self.ref).exists()).scalar():
+                raise err.NotFoundError(ref=self.ref)
         else:
-            return {'data': [self.process_out(row) for row in query]}
+            query = self.query()  # Built even when not counting, so invalid options fail as they would for GET.
+            count = self.options.get('count')
+            if count:
+                count = self.count(count, query)
+                response.set_header('X-Total-Count', str(count['value']))
+                response.set_header('X-Total-Count-Type', count['type'])
+        # Bottle discards the body of HEAD responses, but sets 'Content-Length: 0' for empty ones.  It leaves the length
+        # unset for iterables, which is correct since we don't know how long get()'s body would be.
+        return iter([b'{}'])
 
     def delete(self):
         """
@@ -543,9 +783,9 @@ class RESTController(metaclass=RESTMeta):
             self.db.commit()
             return None
 
-        data = []
-        for instance in query:
-            data.append(self.delete_item(instance))
+        data = self.delete_all(query)
+        if self.errors:
+            raise StopDispatch()
         if not data:
             raise err.NotFoundError()
         self.db.commit()
@@ -554,6 +794,75 @@ class RESTController(metaclass=RESTMeta):
         else:
             return {'data': data}
 
+    def delete_all(self, query):
+        """
+        Deletes all instances matched by query using a single DELETE ... RETURNING statement.
+
+        The DELETE is built from the query's criteria if it selects from nothing but the model's table.  Otherwise (for
+        instance if query() or base_query() add joins), it deletes the primary keys selected by the query as a
+        subquery.  Only if validate_delete() is overridden are the matching instances loaded first, so that each can be
+        checked, and the deletion restricted to their references.  If the statement violates integrity constraints, it
+        is rolled back and the instances are deleted one at a time instead so that each offending reference is reported
+        in self.errors.
+
+        :param query: Query matching the instances to delete.
+        :return: List of results, one per deleted instance.
+        """
+        primary_key = sa.inspect(self.model).primary_key
+        instances = None
+        if type(self).validate_delete is not RESTController.validate_delete:
+            instances = [instance for instance in query if self.validate_delete(instance)]
+            if not instances:
+                return []
+            criteria = self.manager.sql_in([self.manager.from_model(instance) for instance in instances])
+        else:
+            query = query.enable_eagerloads(False)
+            froms = query.statement.froms
+            if len(froms) == 1 and froms[0] is self.model.__table__:
+                criteria = query.whereclause
+            else:
+                keys = query.order_by(None).with_entities(*primary_key).statement
+                if len(primary_key) == 1:
+                    criteria = primary_key[0].in_(keys)
+                else:
+                    criteria = sa.tuple_(*primary_key).in_(keys)
+
+        stmt = self.model.__table__.delete().returning(*primary_key)
+        if criteria is not None:
+            stmt = stmt.where(criteria)
+
+        savepoint = self.db.begin_nested()
+        try:
+            rows = self.db.execute(stmt).fetchall()
+            savepoint.commit()
+        except exc.IntegrityError:
+            savepoint.rollback()
+            return self._delete_individually(query.all() if instances is None else instances)
+        return [self.process_out(None, self.manager.from_model(row), defer=False) for row in rows]
+
+    def _delete_individually(self, instances):
+        """
+        Fallback for delete_all() that deletes each instance in its own SAVEPOINT, recording integrity violations in
+        self.errors rather than aborting on the first one.
+
+        :param instances: Instances to delete, which have already passed validate_delete().
+        :return: List of results, one per deleted instance.
+        """
+        rv = []
+        for instance in instances:
+            ref = self.manager.from_model(instance)
+            savepoint = self.db.begin_nested()
+            try:
+                self.db.delete(instance)
+                self.db.flush()
+                savepoint.commit()
+            except exc.IntegrityError:
+                savepoint.rollback()
+                self.errors.append(err.DatabaseIntegrityViolation(ref=ref))
+                continue
+            rv.append(self.process_out(None, ref, defer=False))
+        return rv
+
     def put(self):
         """
         Called for PUT requests (those that aren't... patched... to PATCH.
@@ -563,18 +872,19 @@ class RESTController(metaclass=RESTMeta):
 
     def preload(self, data=None, _is_refresh=False):
         """
-        Bulk-updates the instance cache.
+        Bulk-updates the instance cache, in chunks of at most bulk_max references.
         :param data: Data dictionary to use.  If None, uses self.data
         :return:
         """
         if data is None:
             data = self.data
 
-        refs = tuple(item['ref'] for item in listify(self.data) if item['ref'] is not None)
+        refs = tuple(item['ref'] for item in listify(data) if item['ref'] is not None)
         if not refs:
             return
 
-        self.cache.add_all(self.query(ref=refs, from_refresh=_is_refresh))
+        for chunk in chunked(refs, self.bulk_max):
+            self.cache.add_all(self.query(ref=chunk, from_refresh=_is_refresh))
         # result = query.merge_all(query)
         # self.cache.add_all(query.merge_all(query))
 
@@ -585,14 +895,89 @@ class RESTController(metaclass=RESTMeta):
         Called for PATCH requests.  Also called for POST requests, which are converted to PATCH.
         :return:
         """
+        if self.options.get('bulk'):
+            return self.patch_bulk()
+
+        rv = self.patch_items(listify(self.data))
+        if self.errors:
+            raise StopDispatch()
+        if self.defer:
+            self.refresh()
+            rv = self.undefer(rv)
+        self.db.commit()
+
+        if not is_list(self.data):
+            return rv[0]
+        return rv
+
+    def patch_bulk(self):
+        """
+        Called for PATCH and POST requests in bulk mode.
+
+        Items are processed in chunks of bulk_max (or bulk_chunk_size if bulk_max is None), each with its own preload
+        and flush, so memory use and lock duration don't grow with the size of the request.
+
+        Relevant options:
+            commit: 'all' (the default) commits once at the end, so any error discards the whole request.  'chunk'
+                commits after each chunk, so an error only discards the chunk it occurred in and any after it.
+            quiet: If True, returns only the number of processed items rather than the results for each one.
+        :return:
+        """
+        commit = self.options.get('commit', 'all')
+        if commit not in ('all', 'chunk'):
+            raise err.JSONValidationError("Commit option must be 'all' or 'chunk'.")
+        quiet = self.options.get('quiet')
+
+        rv = []
+        processed = committed = 0
+        try:
+            # Items are parsed as they are reached, so the body itself can also raise errors partway through.
+            for chunk in chunked(self.data, self.bulk_max or self.bulk_chunk_size):
+                results = self.patch_items(chunk, offset=processed)
+                processed += len(chunk)
+                if self.errors:
+                    raise StopDispatch()
+                if self.defer:
+                    self.refresh(chunk)
+                    results = self.undefer(results)
+                if commit == 'chunk':
+                    self.db.commit()
+                    committed = processed
+                if not quiet:
+                    rv.extend(results)
+                self.cache.clear()
+        except err.APIError as ex:
+            if not committed:
+                raise
+            self.errors.append(ex)
+            self.errors.append(err.PartialCommitError(params={'committed': committed}))
+            raise StopDispatch()
+        except StopDispatch:
+            if committed:
+                self.errors.append(err.PartialCommitError(params={'committed': committed}))
+            raise
+
+        self.db.commit()
+        if quiet:
+            return {'processed': processed}
+        return rv
+
+    def patch_items(self, items, offset=0):
+        """
+        Applies a list of PATCH data items.  Errors are accumulated in self.errors.
+
+        :param items: Sequence of data items.
+        :param offset: Index of the first item within the request, used in error references.
+        :return: List of results, possibly deferred.
+        """
         rv = []
         must_exist = self.options.get('must-exist', True)
         deletes_must_exist = self.options.get('deletes-must-exist', must_exist)
         updates_must_exist = self.options.get('updates-must-exist', must_exist)
 
-        self.preload()
+        self.preload(items)
 
-        for index, item in enumerate(listify(self.data)):
+        for index, item in enumerate(items, offset):
             ref = item['ref']
             value = item['value']
 
@@ -625,16 +1010,6 @@ class RESTController(metaclass=RESTMeta):
                     else:
                         ex.ref = ref
                 self.errors.append(ex)
-
-        if self.errors:
-            raise StopDispatch()
-        if self.defer:
-            self.refresh()
-            rv = self.undefer(rv)
-        self.db.commit()
-
-        if not is_list(self.data):
-            return rv[0]
         return rv
 
     def process_out(self, instance=None, ref=None, defer=False):
@@ -776,13 +1151,39 @@ class SortableRESTController(RESTController):
 
 # noinspection PyAbstractClass
 class InactiveFilterRESTController(RESTController):
-    def query(self, ref=None, from_refresh=False):
-        query = super().query(ref, from_refresh)
+    """
+    Hides inactive instances unless the 'inactive' option is set.  If it is 'only', only inactive instances are shown.
+
+    :cvar archive_model: Model of the archive table that long-inactive rows are moved to by the archive_inactive()
+        database function, or None.  If set, GET and HEAD requests that include inactive instances also read from the
+        archive.  Archived instances can't be modified.
+    """
+    archive_model = None
+
+    def inactive_option(self):
+        """Returns the effective value of the 'inactive' option."""
+        return self.options.get('inactive')
+
+    def base_query(self, session=None):
+        query = super().base_query(session)
+        if self.archive_model is None or self.method not in ('GET', 'HEAD') or not self.inactive_option():
+            return query
+
+        table = self.model.__table__
+        archive = self.archive_model.__table__
+        combined = sa.union_all(
+            sa.select([table]),
+            sa.select([archive.c[column.name] for column in table.columns])
+        ).alias(table.name + '_with_archive')
+        return query.select_entity_from(combined)
+
+    def query(self, ref=None, from_refresh=False, session=None):
+        query = super().query(ref, from_refresh, session)
         if from_refresh:
             return query
 
         field = self.model.date_inactive
-        inactive = self.options.get('inactive')
+        inactive = self.inactive_option()
         if inactive:
             if inactive == 'only':
                 return query.filter(field.isnot(None))
@@ -799,3 +1200,63 @@ class InactiveFilterRESTController(RESTController):
             instance.date_inactive = None
         elif instance.date_inactive is None:
             instance.date_inactive = datetime.datetime.now()
+
+
+# noinspection PyAbstractClass
+class DeltaSyncRESTController(InactiveFilterRESTController):
+    """
+    Lets clients keep a copy of a collection up to date by fetching only what changed since they last looked.
+
+    Rows carry a modification sequence (the model's modseq column, maintained by trigger), and collection GETs also
+    return the collection's current 'sequence'.  Passing that back as the 'since' option returns only rows changed after
+    it: active ones in 'data', and ones that have since become inactive (or been archived) as tombstones in 'deleted'.
+    Tombstones are references whose value is null, just like deletions reported elsewhere.  The 'since' option can't
+    be combined with 'limit' or 'offset', since the new sequence is only valid for a complete set of changes.  A row may
+    occasionally be sent again by the next sync, but a change is never missed.
+    """
+    def get_since(self):
+        """Returns the value of the 'since' option, or None if it isn't set."""
+        since = self.options.get('since')
+        if since is None or self.method not in ('GET', 'HEAD'):
+            return None
+        try:
+            since = int(since)
+        except (TypeError, ValueError):
+            raise err.JSONValidationError("Since option must be an integer.")
+        if self.options.get('limit') is not None or self.options.get('offset') is not None:
+            raise err.JSONValidationError("Since option can't be combined with limit or offset.")
+        return since
+
+    def inactive_option(self):
+        # Rows that became inactive are needed to produce tombstones.
+        if self.get_since() is not None:
+            return True
+        return super().inactive_option()
+
+    def query(self, ref=None, from_refresh=False, session=None):
+        query = super().query(ref, from_refresh, session)
+        since = self.get_since()
+        if from_refresh or ref is not None or since is None:
+            return query
+        return query.filter(self.model.modseq > since)
+
+    def get(self):
+        if self.ref:
+            return super().get()
+
+        # Must be read before the rows are, so anything committed in between is picked up by the next sync.
+        sequence = latci.database.sql.modseq_watermark(self.db)
+        if self.get_since() is None:
+            rv = super().get()
+        else:
+            rv = {'data': [], 'deleted': []}
+            for row in self.get_query():
+                if row.date_inactive is None:
+                    rv['data'].append(self.process_out(row))
+                else:
+                    rv['deleted'].append(self.process_out(None, self.manager.from_model(row), defer=False))
+            count = self.options.get('count')
+            if count:
+                rv['count'] = self.count(count)
+        rv['sequence'] = sequence
+        return rv
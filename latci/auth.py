@@ -26,8 +26,6 @@ If we receive a SessionID, we do the following:
 * Check to see if it's expired
 * Return login information
 """
-import oauth2client.client
-from oauth2client.crypt import AppIdentityError
 import time
 from sqlalchemy import orm
 from latci import config
@@ -125,7 +123,14 @@ class AuthSession:
     :ivar session: Session attached to this result.
     :ivar error: Description of authentication error, if any.
     """
-    schema = models.Staff.SchemaClass(only=('email', 'name_first', 'name_last', 'id'))
+    _schema = None
+
+    @classmethod
+    def get_schema(cls):
+        """Returns the schema used to dump staff, creating it on first use."""
+        if cls._schema is None:
+            cls._schema = models.Staff.SchemaClass(only=('email', 'name_first', 'name_last', 'id'))
+        return cls._schema
 
     def __json__(self):
         rv = {
@@ -166,7 +171,7 @@ class AuthSession:
                 staff.last_visited = datetime.datetime.now()
                 db.add(staff)
                 db.commit()
-                self.staff = self.schema.dump(staff).data
+                self.staff = self.get_schema().dump(staff).data
                 self.is_valid = True
                 self.is_guest = False
                 return
@@ -176,6 +181,10 @@ class AuthSession:
     def parse_token(self, token):
         """Assists in validation of id_tokens from Google Signin"""
 
+        # Deferred, since oauth2client pulls in the crypto libraries and isn't needed until someone logs in.
+        import oauth2client.client
+        from oauth2client.crypt import AppIdentityError
+
         oauth_error = None
 
         # oauth2client's verify_id_token is nice and does a lot of validation for us, BUT... it's not particularly
@@ -226,7 +235,9 @@ class AuthSession:
         if request is None:
             request = bottle.request
 
+        # Bodies too large for Bottle to parse in one go (e.g. bulk requests) must authenticate with the header instead.
         if (
+                request.content_length <= request.MEMFILE_MAX and
                 isinstance(request.json, collections.abc.Mapping) and
                 isinstance(request.json.get('auth'), collections.abc.Mapping)
         ):
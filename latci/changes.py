@@ -0,0 +1,249 @@
+"""
+latci.changes - Live change feed, delivered to clients as Server-Sent Events.
+
+Triggers on attendance and activity_enrollment send a notification on the 'latci_changes' channel for every changed
+row (see notify_change_tproc() in db/schema.sql).  Each worker process keeps a single connection LISTENing on that
+channel, in a background thread, and fans each notification out to the subscribers whose filters it matches.  Each
+subscriber is one open GET /api/v2/changes request.
+
+Serving the feed ties up a request thread per connected client, so it needs a threaded (or otherwise concurrent)
+server.
+"""
+import datetime
+import itertools
+import logging
+import queue
+import select
+import threading
+import time
+
+import bottle
+
+import latci.database
+import latci.json
+import latci.api.errors as err
+from latci import config
+
+CHANNEL = 'latci_changes'
+TABLES = ('attendance', 'activity_enrollment')
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    """
+    A single client's view of the change feed.
+
+    :ivar queue: Events waiting to be sent to the client.
+    :ivar overflowed: True if the client fell so far behind that events were discarded.
+    """
+    def __init__(self, tables=TABLES, activities=None, date=None, queue_size=1000):
+        """
+        :param tables: Tables to receive changes for.
+        :param activities: Set of activity ids to receive changes for.  None means all.
+        :param date: Only receive attendance changes for this date, and enrollment changes that include it.  None
+            means all dates.
+        :param queue_size: Maximum number of events waiting to be sent.
+        """
+        self.tables = set(tables)
+        self.activities = activities
+        self.date = date
+        self.queue = queue.Queue(queue_size)
+        self.overflowed = False
+
+    def matches(self, event):
+        if event['table'] not in self.tables:
+            return False
+        row = event['row']
+        if self.activities is not None and row.get('activity_id') not in self.activities:
+            return False
+        if self.date is not None:
+            if event['table'] == 'attendance':
+                return row.get('date') == self.date
+            start, end = row.get('start_date'), row.get('end_date')
+            return (start is None or start <= self.date) and (end is None or self.date <= end)
+        return True
+
+    def offer(self, event):
+        """Queues an event without blocking.  Returns False if the subscriber has fallen too far behind."""
+        try:
+            self.queue.put_nowait(event)
+            return True
+        except queue.Full:
+            self.overflowed = True
+            return False
+
+
+class ChangeListener:
+    """
+    Listens for change notifications on a dedicated connection and distributes them to subscribers.
+
+    The listening thread starts with the first subscriber, and reconnects (with backoff) if its connection fails.
+    """
+    def __init__(self, engine, channel=CHANNEL, poll_interval=5.0):
+        self.engine = engine
+        self.channel = channel
+        self.poll_interval = poll_interval
+        self.subscribers = set()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.ids = itertools.count(1)
+
+    def subscribe(self, subscription):
+        with self.lock:
+            self.subscribers.add(subscription)
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name='latci-change-listener', daemon=True)
+                self.thread.start()
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            self.subscribers.discard(subscription)
+
+    def publish(self, payload):
+        try:
+            event = latci.json.loads(payload)
+        except ValueError:
+            logger.warning("Ignoring malformed change notification: %r", payload)
+            return
+        event['id'] = next(self.ids)
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for subscription in subscribers:
+            if not subscription.overflowed and subscription.matches(event):
+                subscription.offer(event)
+
+    def run(self):
+        backoff = 1
+        while True:
+            with self.lock:
+                if not self.subscribers:
+                    # Nobody is listening any more, so let the connection go.  The next subscriber starts a new thread.
+                    self.thread = None
+                    return
+            try:
+                self.listen()
+                backoff = 1
+            except Exception:
+                logger.exception("Change listener connection failed, reconnecting in %d seconds.", backoff)
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 60)
+
+    def listen(self):
+        """Holds a LISTENing connection open until there are no more subscribers."""
+        # A connection of our own, outside of the pool, since it's held indefinitely.
+        fairy = self.engine.raw_connection()
+        fairy.detach()
+        connection = fairy.connection
+        try:
+            connection.autocommit = True
+            cursor = connection.cursor()
+            cursor.execute("LISTEN " + self.channel)
+            while True:
+                with self.lock:
+                    if not self.subscribers:
+                        return
+                if select.select([connection], [], [], self.poll_interval) == ([], [], []):
+                    continue
+                connection.poll()
+                while connection.notifies:
+                    self.publish(connection.notifies.pop(0).payload)
+        finally:
+            connection.close()
+
+
+_listener = None
+_listener_lock = threading.Lock()
+
+
+def get_listener():
+    """Returns this process's ChangeListener, creating it if needed."""
+    global _listener
+    with _listener_lock:
+        if _listener is None:
+            _listener = ChangeListener(latci.database.engine)
+        return _listener
+
+
+def format_event(name=None, data=None, event_id=None):
+    """Formats a single Server-Sent Event as bytes."""
+    lines = []
+    if event_id is not None:
+        lines.append('id: {}'.format(event_id))
+    if name is not None:
+        lines.append('event: {}'.format(name))
+    lines.append('data: ' + latci.json.dumps(data))
+    return ('\n'.join(lines) + '\n\n').encode('utf-8')
+
+
+def stream(subscription, heartbeat):
+    """
+    Generates the Server-Sent Events for a subscription, until the client disconnects or falls too far behind.
+
+    :param subscription: Subscription to stream.
+    :param heartbeat: Seconds between keepalive comments, which also detect disconnected clients.
+    """
+    listener = get_listener()
+    listener.subscribe(subscription)
+    try:
+        yield 'retry: 5000\n\n'.encode('utf-8')
+        while True:
+            try:
+                event = subscription.queue.get(timeout=heartbeat)
+            except queue.Empty:
+                yield b': keepalive\n\n'
+                continue
+            yield format_event(
+                name=event['table'], event_id=event['id'], data={'op': event['op'], 'row': event['row']}
+            )
+            if subscription.overflowed and subscription.queue.empty():
+                # Events were lost, so the client needs to start over from a fresh fetch.
+                yield format_event(name='reset', data={'reason': 'overflow'})
+                return
+    finally:
+        listener.unsubscribe(subscription)
+
+
+def changes_view():
+    """
+    Handles GET /api/v2/changes
+
+    Streams changes to attendance and enrollments as Server-Sent Events, for use with the browser's EventSource.
+    Events are named after the table that changed, and their data looks like {"op": "insert", "row": {...}}.  A
+    'reset' event means events were lost and the client should refetch what it's displaying.  Events are not replayed
+    on reconnection, so clients should also refetch after reconnecting.
+
+    Query parameters:
+        tables: Comma-separated list of tables to watch.  Defaults to all of them.
+        activity: Comma-separated list of activity ids to watch.  Defaults to all activities.
+        date: Only watch attendance for this date (and enrollments that include it), in YYYY-MM-DD format.
+    """
+    try:
+        tables = config.coerce_domainlist(bottle.request.query.get('tables', '')) or TABLES
+        unknown = set(tables) - set(TABLES)
+        if unknown:
+            raise err.JSONValidationError("Unknown table(s): {}".format(", ".join(sorted(unknown))))
+        activities = None
+        if bottle.request.query.get('activity'):
+            try:
+                activities = set(int(value) for value in config.coerce_domainlist(bottle.request.query.activity))
+            except ValueError:
+                raise err.JSONValidationError("The 'activity' parameter must be a list of integers.")
+        date = None
+        if bottle.request.query.get('date'):
+            try:
+                date = datetime.datetime.strptime(bottle.request.query.date, '%Y-%m-%d').date().isoformat()
+            except ValueError:
+                raise err.JSONValidationError("The 'date' parameter must be a date in YYYY-MM-DD format.")
+    except err.APIError as ex:
+        ex.modify_response(bottle.response)
+        return {'errors': [ex]}
+
+    subscription = Subscription(
+        tables=tables, activities=activities, date=date, queue_size=config.CHANGE_FEED_QUEUE_SIZE
+    )
+    bottle.response.content_type = 'text/event-stream'
+    # no-transform keeps the compression middleware from buffering events.
+    bottle.response.set_header('Cache-Control', 'no-cache, no-transform')
+    bottle.response.set_header('X-Accel-Buffering', 'no')  # Likewise for nginx
+    return stream(subscription, config.CHANGE_FEED_HEARTBEAT_SECONDS)
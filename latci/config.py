@@ -7,6 +7,7 @@ or modify server.ini
 """
 import functools
 import configparser
+import logging
 import os
 import inspect
 
@@ -23,9 +24,37 @@ SERVE_STATIC_FILES = False
 # DATABASE_PATH = ""
 DATABASE_SCHEMA = "listenandtalk"
 
+# Read-only replicas of the database.  If any are configured, GET and HEAD API requests are served from a randomly
+# chosen replica, except for clients that have written something within the last REPLICA_PIN_SECONDS seconds.
+DATABASE_REPLICA_PATHS = []
+REPLICA_PIN_SECONDS = 5
+
+# Compress responses for clients that accept it.  Bodies smaller than COMPRESS_MIN_SIZE bytes are sent as-is.
+# COMPRESS_LEVEL runs from 1 (fastest) to 9 (smallest).  Disable this if it's being handled upstream.
+COMPRESS_RESPONSES = True
+COMPRESS_MIN_SIZE = 1024
+COMPRESS_LEVEL = 6
+
+# Perform expensive initialization (schema generation, authentication libraries, WARM_UP_CONNECTIONS database
+# connections per engine) at startup instead of on first use.  Useful if the server loads the application before it
+# starts accepting requests.
+WARM_UP = False
+WARM_UP_CONNECTIONS = 2
+
+# Live change feed (GET /api/v2/changes).  Idle streams get a keepalive every CHANGE_FEED_HEARTBEAT_SECONDS seconds.
+# Clients that fall more than CHANGE_FEED_QUEUE_SIZE events behind are told to reset and disconnected.
+CHANGE_FEED_HEARTBEAT_SECONDS = 15
+CHANGE_FEED_QUEUE_SIZE = 1000
+
 # Whether to echo queries.  Only set True for debugging.
 DEBUG_SQL = False
 
+# Logging.  Records are written as JSON lines to LOG_FILE, or stderr if it is None, by a background thread.  At most
+# LOG_QUEUE_SIZE records wait to be written; beyond that, new records are dropped rather than slowing requests down.
+LOG_LEVEL = 'INFO'
+LOG_FILE = None
+LOG_QUEUE_SIZE = 10000
+
 # Google Auth
 # Get this information from the Google Developers Console
 # OAUTH2_CLIENT_ID = ''
@@ -64,6 +93,32 @@ AUTH_REALM = 'latci'
 # Unrecognized responses are treated as the default.
 EXCEPTION_HANDLING = 'native'
 
+# Collection GETs with the 'count' option count rows exactly up to this many results, and fall back to the query
+# planner's estimate beyond it.  0 means always estimate.
+COUNT_EXACT_THRESHOLD = 1000
+
+# Students, staff and activities that have been inactive for longer than this many days are moved to archive tables,
+# along with their attendance, attendance history and enrollments, by 'application.py archive'.
+ARCHIVE_INACTIVE_DAYS = 730
+
+# Retention policy for attendance history, applied by 'application.py maintain-history'.  Monthly partitions older than
+# HISTORY_COMPACT_DAYS are reduced to the latest history entry per attendance record, and those older than
+# HISTORY_RETAIN_DAYS are dropped.  0 disables either step.
+HISTORY_COMPACT_DAYS = 365
+HISTORY_RETAIN_DAYS = 0
+
+# Attendance partition maintenance, applied by 'application.py maintain-partitions', which should be scheduled to run
+# at least monthly.  Monthly attendance and history partitions are created ATTENDANCE_MONTHS_AHEAD months in advance
+# (until then, rows go to a catch-all DEFAULT partition), and those older than ATTENDANCE_DETACH_DAYS are detached (but
+# not dropped) from the attendance table.  0 disables detaching.
+ATTENDANCE_MONTHS_AHEAD = 3
+ATTENDANCE_DETACH_DAYS = 0
+
+# Static files up to STATIC_CACHE_MAX_SIZE bytes are kept in memory, and checked for changes at most once every
+# STATIC_CACHE_CHECK_SECONDS seconds.  Larger files are sent from disk.
+STATIC_CACHE_MAX_SIZE = 1024 * 1024
+STATIC_CACHE_CHECK_SECONDS = 2.0
+
 # Where static files are located
 STATIC_FILES_PATH = os.path.abspath(os.path.join(_our_path, "../client"))
 
@@ -91,9 +146,20 @@ coerce_domainset = functools.partial(coerce_domainlist, cast=set)
 options = [
     ('API_PREFIX', str),
     ('SERVE_STATIC_FILES', coerce_bool),
+    ('STATIC_CACHE_MAX_SIZE', int),
+    ('STATIC_CACHE_CHECK_SECONDS', float),
+    ('COMPRESS_RESPONSES', coerce_bool),
+    ('COMPRESS_MIN_SIZE', int),
+    ('COMPRESS_LEVEL', int),
 
     ('DATABASE_PATH', str),
     ('DATABASE_SCHEMA', str),
+    ('DATABASE_REPLICA_PATHS', coerce_domainlist),
+    ('REPLICA_PIN_SECONDS', int),
+    ('WARM_UP', coerce_bool),
+    ('WARM_UP_CONNECTIONS', int),
+    ('CHANGE_FEED_HEARTBEAT_SECONDS', float),
+    ('CHANGE_FEED_QUEUE_SIZE', int),
     ('OAUTH2_CLIENT_ID', str),
     ('OAUTH2_CLIENT_SECRET', str),
     ('OAUTH2_ISSUERS', coerce_domainset),
@@ -101,6 +167,17 @@ options = [
     ('AUTH_TRUSTED_PROXIES', coerce_domainset),
     ('AUTH_REALM', str),
 
+    ('COUNT_EXACT_THRESHOLD', int),
+    ('ARCHIVE_INACTIVE_DAYS', int),
+    ('HISTORY_COMPACT_DAYS', int),
+    ('HISTORY_RETAIN_DAYS', int),
+    ('ATTENDANCE_MONTHS_AHEAD', int),
+    ('ATTENDANCE_DETACH_DAYS', int),
+
+    ('LOG_LEVEL', str),
+    ('LOG_FILE', lambda x: x or None),
+    ('LOG_QUEUE_SIZE', int),
+
     ('DEBUG_SQL', coerce_bool),
     ('DEBUG_SKIP_LOGIN', coerce_bool),
     ('DEBUG_LOGIN_AS', lambda x: None if not x else int(x)),
@@ -123,7 +200,7 @@ else:
             break
         path = os.path.join(path, "..")
     else:
-        print('Warning: Could not find server.ini file.')
+        logging.getLogger(__name__).warning('Could not find server.ini file.')
 
 
 g = globals()
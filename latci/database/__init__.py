@@ -1,24 +1,72 @@
+import random
+
 import sqlalchemy
 import sqlalchemy.event
 import sqlalchemy.orm
 
 from latci import config
 
-engine = sqlalchemy.create_engine(config.DATABASE_PATH, echo=True)
 
-# @sqlalchemy.event.listens_for(engine, 'engine_connect')
-# def set_schema_upon_connection(conn, _):
-#     """Forces schema change upon a connection to the database."""
-#     conn.execute("SET search_path={},public".format(config.DATABASE_SCHEMA))
-#     conn.execute("COMMIT")
+def create_engine(path, readonly=False):
+    """
+    Creates an engine connected to path, with connections set to use our schema.
+
+    :param path: Database URL.
+    :param readonly: If True, all transactions on this engine are READ ONLY.
+    :return: New engine.
+    """
+    # Queries are logged through latci.log when config.DEBUG_SQL is set, rather than echoed synchronously.
+    engine = sqlalchemy.create_engine(path)
+
+    # @sqlalchemy.event.listens_for(engine, 'engine_connect')
+    # def set_schema_upon_connection(conn, _):
+    #     """Forces schema change upon a connection to the database."""
+    #     conn.execute("SET search_path={},public".format(config.DATABASE_SCHEMA))
+    #     conn.execute("COMMIT")
+
+    @sqlalchemy.event.listens_for(engine, 'checkout')
+    def set_schema_upon_connection(dbapi_conection, connection_record, connection_proxy):
+        """Forces schema change upon a connection to the database."""
+        cur = dbapi_conection.cursor()
+        cur.execute("SET search_path={},public".format(config.DATABASE_SCHEMA))
+        cur.execute("COMMIT")
+
+    if readonly:
+        @sqlalchemy.event.listens_for(engine, 'connect')
+        def set_readonly_upon_connection(dbapi_connection, connection_record):
+            """Makes every transaction on this connection READ ONLY."""
+            dbapi_connection.set_session(readonly=True)
+
+    return engine
 
 
-@sqlalchemy.event.listens_for(engine, 'checkout')
-def set_schema_upon_connection(dbapi_conection, connection_record, connection_proxy):
-    """Forces schema change upon a connection to the database."""
-    cur = dbapi_conection.cursor()
-    cur.execute("SET search_path={},public".format(config.DATABASE_SCHEMA))
-    cur.execute("COMMIT")
+engine = create_engine(config.DATABASE_PATH)
+replica_engines = [create_engine(path, readonly=True) for path in config.DATABASE_REPLICA_PATHS]
 
 Session = sqlalchemy.orm.sessionmaker(bind=engine, autocommit=False)
+ReplicaSession = sqlalchemy.orm.sessionmaker(autocommit=False)
+
+
+def engine_for_read(primary=False):
+    """
+    Chooses the engine a read-only request should use: a randomly chosen replica, or the primary if none are configured.
+
+    :param primary: If True, always use the primary (e.g. because the client must see its own recent writes.)
+    :return: Engine.
+    """
+    if primary or not replica_engines:
+        return engine
+    return random.choice(replica_engines)
+
+
+def session_for_read(primary=False):
+    """
+    Returns a new read-only session for a read-only request, as chosen by engine_for_read(), or None if the request
+    should use the primary's regular session instead.
 
+    :param primary: If True, always use the primary.
+    """
+    bind = engine_for_read(primary)
+    if bind is engine:
+        return None
+    return ReplicaSession(bind=bind)
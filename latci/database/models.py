@@ -5,29 +5,50 @@ NOTE: The schema here is not fully representative of the actual database.
 
 Notably, stored procedures, triggers, indexes and foreign key constraints are not fully represented.
 """
-from sqlalchemy import Column, ForeignKey, sql
+from sqlalchemy import Column, FetchedValue, ForeignKey, sql
 
 # SQL Types
 from sqlalchemy.types import *
 from sqlalchemy.dialects.postgresql import INET  # IP Addresses (non-standard type)
 
 # ORM
-from sqlalchemy.orm import relationship, backref, mapper, configure_mappers
+from sqlalchemy.orm import relationship, backref, configure_mappers
 from sqlalchemy.ext.declarative import as_declarative, declared_attr
 from sqlalchemy.ext.hybrid import hybrid_property
-import sqlalchemy.event
 
 import re
 import datetime
 from latci import config
-import latci.schema
+
+
+class _SchemaClassDescriptor():
+    """
+    Generates a model's Marshmallow schema the first time its SchemaClass is used, rather than at import time.
+
+    Each class caches its own schema, so subclasses never see a parent's.  Models may still define SchemaClass
+    explicitly, which takes precedence.
+    """
+    def __get__(self, instance, owner):
+        schema_class = owner.__dict__.get('_schema_class')
+        if schema_class is None:
+            schema_class = _make_schema_class(owner)
+            owner._schema_class = schema_class
+        return schema_class
 
 
 @as_declarative()
 class Model():
     """
     Base class for all ORM Objects (which correspond to tables in the database.
+
+    Server-generated values (autoincrement ids, SQL expression defaults, and any columns declared with FetchedValue()
+    server defaults, such as trigger-maintained ones) are fetched with RETURNING as part of each INSERT or UPDATE, so
+    instances are complete as soon as they are flushed and never need to be re-SELECTed.
     """
+    SchemaClass = _SchemaClassDescriptor()
+
+    __mapper_args__ = {'eager_defaults': True}
+
     # Allow lazy evalaution of schema internal property.
     @property
     def schema(self):
@@ -89,6 +110,16 @@ class UniqueLookupTable(LookupTable):
 class TimestampMixin():
     date_created = Column(DateTime(timezone=True), default=sql.func.now())
     date_inactive = Column(DateTime(timezone=True), default=None)
+    # Modification sequence, maintained by trigger (see modseq_tproc() in db/schema.sql) and fetched on flush.
+    modseq = Column(BigInteger, nullable=False, server_default=FetchedValue(), server_onupdate=FetchedValue())
+
+
+class ArchiveMixin():
+    """
+    Mixin class for archive tables, which hold rows moved out of their corresponding table by the archive_inactive()
+    database function.  Archive tables have no foreign keys.
+    """
+    date_archived = Column(DateTime(timezone=True), nullable=False, default=sql.func.now())
 
 
 class Student(Model, TimestampMixin):
@@ -148,10 +179,13 @@ class ActivityEnrollment(Model):
 
 
 class Attendance(Model):
-    id = Column(Integer, primary_key=True, nullable=False, autoincrement=True)
-    student_id = Column(Integer, ForeignKey('student.id'), nullable=False)
-    activity_id = Column(Integer, ForeignKey('activity.id'), nullable=False)
-    date = Column(Date, nullable=False)
+    """Partitioned by month of date."""
+    class Meta:
+        writable_pk = True
+
+    student_id = Column(Integer, ForeignKey('student.id'), primary_key=True, nullable=False)
+    activity_id = Column(Integer, ForeignKey('activity.id'), primary_key=True, nullable=False)
+    date = Column(Date, primary_key=True, nullable=False)
     status_id = Column(Integer, ForeignKey('attendance_status.id'), nullable=False)
     comment = Column(Text, nullable=True)
     date_entered = Column(DateTime(timezone=True), nullable=False, default=sql.func.now())
@@ -163,6 +197,24 @@ class Attendance(Model):
 
 class AttendanceUpsert(Model):
     """Virtual table."""
+    student_id = Column(Integer, ForeignKey('student.id'), primary_key=True, nullable=False)
+    activity_id = Column(Integer, ForeignKey('activity.id'), primary_key=True, nullable=False)
+    date = Column(Date, primary_key=True, nullable=False)
+    status_id = Column(Integer, ForeignKey('attendance_status.id'), nullable=False)
+    comment = Column(Text, nullable=True)
+    date_entered = Column(DateTime(timezone=True), nullable=False, default=sql.func.now())
+
+    student = relationship('Student')
+    activity = relationship('Activity')
+    status = relationship('AttendanceStatus', lazy='joined')
+
+
+class AttendanceHistory(Model):
+    """
+    Previous versions of attendance records, maintained by trigger.  Partitioned by month of the attendance date.
+
+    In the database, the primary key is (id, date) since partitioned tables require it, but id alone is unique.
+    """
     id = Column(Integer, primary_key=True, nullable=False, autoincrement=True)
     student_id = Column(Integer, ForeignKey('student.id'), nullable=False)
     activity_id = Column(Integer, ForeignKey('activity.id'), nullable=False)
@@ -171,42 +223,96 @@ class AttendanceUpsert(Model):
     comment = Column(Text, nullable=True)
     date_entered = Column(DateTime(timezone=True), nullable=False, default=sql.func.now())
 
-    student = relationship('Student')
-    activity = relationship('Activity')
-    status = relationship('AttendanceStatus', lazy='joined')
+
+class StudentArchive(Model, TimestampMixin, ArchiveMixin):
+    id = Column(Integer, primary_key=True, nullable=False, autoincrement=False)
+    name_first = Column(Text, nullable=False)
+    name_last = Column(Text, nullable=False)
+
+
+class StaffArchive(Model, TimestampMixin, ArchiveMixin):
+    id = Column(Integer, primary_key=True, nullable=False, autoincrement=False)
+    name_first = Column(Text, nullable=False)
+    name_last = Column(Text, nullable=False)
+    email = Column(Text, nullable=True)
+    can_login = Column(Boolean, nullable=False, default=True)
+    last_ip = Column(INET())
+    last_visited = Column(DateTime(timezone=True))
+
+
+class ActivityArchive(Model, TimestampMixin, ArchiveMixin):
+    id = Column(Integer, primary_key=True, nullable=False, autoincrement=False)
+    name = Column(Text, nullable=False)
+
+    staff_id = Column(Integer, nullable=False)
+    location_id = Column(Integer, nullable=False)
+    category_id = Column(Integer, nullable=False)
+
+    start_date = Column(Date, nullable=False)
+    end_date = Column(Date, nullable=False)
+
+
+class ActivityEnrollmentArchive(Model, ArchiveMixin):
+    id = Column(Integer, primary_key=True, nullable=False, autoincrement=False)
+    activity_id = Column(Integer, nullable=False)
+    student_id = Column(Integer, nullable=False)
+
+    start_date = Column(Date, nullable=False)
+    end_date = Column(Date, nullable=True)
+
+
+class AttendanceArchive(Model, ArchiveMixin):
+    student_id = Column(Integer, primary_key=True, nullable=False)
+    activity_id = Column(Integer, primary_key=True, nullable=False)
+    date = Column(Date, primary_key=True, nullable=False)
+    status_id = Column(Integer, nullable=False)
+    comment = Column(Text, nullable=True)
+    date_entered = Column(DateTime(timezone=True), nullable=False)
+
+
+class AttendanceHistoryArchive(Model, ArchiveMixin):
+    id = Column(Integer, primary_key=True, nullable=False, autoincrement=False)
+    student_id = Column(Integer, nullable=False)
+    activity_id = Column(Integer, nullable=False)
+    date = Column(Date, nullable=False)
+    status_id = Column(Integer, nullable=False)
+    comment = Column(Text, nullable=True)
+    date_entered = Column(DateTime(timezone=True), nullable=False)
 
 
 # Automatically generate Marshmallow schemas from ORM Models.  Adapted from
 # https://marshmallow-sqlalchemy.readthedocs.org/en/latest/recipes.html#automatically-generating-schemas-for-sqlalchemy-models
 # and heavily modified.
-@sqlalchemy.event.listens_for(mapper, 'after_configured')
+def _make_schema_class(class_):
+    import latci.schema  # Deferred, since marshmallow is slow to import.
+
+    # if class_.__name__.endswith('Schema'):
+    #     raise ModelConversionError(
+    #         "For safety, setup_schema can not be used when a Model class ends with 'Schema'"
+    #     )
+
+    # Determine schema metaclass
+    meta_base = getattr(class_, 'Meta', object)
+    if meta_base is not object and hasattr(meta_base, 'model'):
+        Meta = meta_base
+    else:
+        class Meta(meta_base):
+            model = class_
+
+    return type(
+        "{}Schema".format(class_.__name__),  # Name of new class
+        (latci.schema.Schema,),  # Subclasses
+        {'Meta': Meta}  # Members
+    )
+
+
 def setup_schema():
+    """
+    Configures mappers and generates every model's schema up front.  Otherwise, both happen on first use.
+    """
+    configure_mappers()
     # noinspection PyProtectedMember
     for class_ in Model._decl_class_registry.values():
         if not hasattr(class_, '__tablename__'):
             continue  # Skip abstract classes that don't have an underlying table.
-
-        if hasattr(class_, 'SchemaClass'):
-            continue
-
-        # if class_.__name__.endswith('Schema'):
-        #     raise ModelConversionError(
-        #         "For safety, setup_schema can not be used when a Model class ends with 'Schema'"
-        #     )
-
-        # Determine schema metaclass
-        meta_base = getattr(class_, 'Meta', object)
-        if meta_base is not object and hasattr(meta_base, 'model'):
-            Meta = meta_base
-        else:
-            class Meta(meta_base):
-                model = class_
-
-        schema_class = type(
-            "{}Schema".format(class_.__name__),  # Name of new class
-            (latci.schema.Schema,),  # Subclasses
-            {'Meta': Meta}  # Members
-        )
-        setattr(class_, 'SchemaClass', schema_class)
-
-configure_mappers()
+        class_.SchemaClass
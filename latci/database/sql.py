@@ -0,0 +1,56 @@
+"""
+latci.database.sql - Additional SQL constructs and helpers that SQLAlchemy doesn't provide out of the box.
+"""
+from sqlalchemy import func, select
+from sqlalchemy.sql.expression import Executable, ClauseElement, _literal_as_text
+from sqlalchemy.ext.compiler import compiles
+
+
+class Explain(Executable, ClauseElement):
+    """
+    Represents an EXPLAIN of another statement.  Executing it returns the plan in JSON format as a single scalar.
+
+    Adapted from the SQLAlchemy wiki's 'Explain' recipe.
+    """
+    def __init__(self, statement, analyze=False):
+        """
+        :param statement: Statement (or ORM Query) to explain.
+        :param analyze: If True, actually runs the statement (EXPLAIN ANALYZE)
+        """
+        self.statement = _literal_as_text(getattr(statement, 'statement', statement))
+        self.analyze = analyze
+
+
+@compiles(Explain, 'postgresql')
+def _compile_explain(element, compiler, **kw):
+    options = 'ANALYZE, FORMAT JSON' if element.analyze else 'FORMAT JSON'
+    return 'EXPLAIN ({}) {}'.format(options, compiler.process(element.statement, **kw))
+
+
+def estimate_rows(db, statement):
+    """
+    Returns the query planner's estimate of how many rows a statement will return, without running it.
+
+    :param db: Database session or connection.
+    :param statement: Statement (or ORM Query) to estimate.
+    :return: Estimated row count.
+    """
+    plan = db.execute(Explain(statement)).scalar()
+    if isinstance(plan, str):
+        # psycopg2 only parses the result for us if it recognizes the json type.
+        import latci.json
+        plan = latci.json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def modseq_watermark(db):
+    """
+    Returns the highest modification sequence (see modseq_tproc() in db/schema.sql) that is known to be final.
+
+    Every transaction that could have assigned a modification sequence at or below this value has finished, so any row
+    that is uncommitted now or changes later ends up with a higher one.  Call this before reading the rows, not after.
+
+    :param db: Database session or connection.
+    :return: Modification sequence.
+    """
+    return db.execute(select([func.txid_snapshot_xmin(func.txid_current_snapshot()) - 1])).scalar()
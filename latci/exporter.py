@@ -0,0 +1,207 @@
+"""
+latci.exporter - Streaming export of attendance data.
+
+Exports are produced entirely by PostgreSQL with COPY (...) TO STDOUT and streamed to the client as they arrive, without
+building Python row objects or holding the whole export in memory.
+"""
+import datetime
+import queue
+import threading
+
+import bottle
+
+import latci.database
+import latci.api.errors as err
+from latci.api import rest
+
+
+# The reporting query from db/queries/attendance.sql.  Filters are appended to it.
+ATTENDANCE_REPORT = """
+SELECT
+    s.id AS student_id, s.name_first AS student_name_first, s.name_last AS student_name_last,
+    t.id AS staff_id, t.name_first AS staff_name_first, t.name_last AS staff_name_last,
+    act.id AS activity_id, act.name AS activity_name, cat.id AS category_id, cat.name AS category_name,
+    a.date, a.date_entered, a.status_id, a.comment, status.name AS status_name
+FROM
+    attendance AS a
+    LEFT JOIN attendance_status AS status ON a.status_id=status.id
+    INNER JOIN activity AS act ON act.id=a.activity_id
+        INNER JOIN staff AS t ON act.staff_id=t.id
+        INNER JOIN category AS cat ON cat.id=act.category_id
+    INNER JOIN student AS s ON a.student_id=s.id
+WHERE
+    a.date BETWEEN %(from)s AND %(to)s
+"""
+
+# Optional filters: query parameter -> SQL condition
+ATTENDANCE_FILTERS = {
+    'activity': 'act.id=%(activity)s',
+    'staff': 't.id=%(staff)s',
+    'category': 'cat.id=%(category)s',
+}
+
+FORMATS = {
+    # CSV with a header row.
+    'csv': ('text/csv', "COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER)"),
+    # One JSON object per line.  CSV format with a quote and delimiter that never appear in row_to_json() output
+    # passes the JSON through untouched, where text format would escape its backslashes.
+    'ndjson': (
+        'application/x-ndjson',
+        "COPY (SELECT row_to_json(r) FROM ({query}) AS r) TO STDOUT WITH (FORMAT csv, QUOTE E'\\x01', DELIMITER E'\\x02')"
+    ),
+}
+
+
+class _QueueWriter:
+    """
+    File-like object that feeds whatever is written to it into a queue, for consumption by another thread.
+
+    COPY writes one row at a time, so output is collected into chunks of about chunk_size bytes first.  flush() must be
+    called at the end to send whatever is left.
+    """
+    def __init__(self, q, cancelled, chunk_size=65536):
+        self.queue = q
+        self.cancelled = cancelled
+        self.chunk_size = chunk_size
+        self.buffer = bytearray()
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        self.buffer += data
+        if len(self.buffer) >= self.chunk_size:
+            self.flush()
+        return len(data)
+
+    def flush(self):
+        if not self.buffer:
+            return
+        chunk = bytes(self.buffer)
+        self.buffer.clear()
+        while True:
+            if self.cancelled.is_set():
+                raise IOError("Export cancelled.")
+            try:
+                self.queue.put(chunk, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+
+def stream_copy(engine, sql, params=None, buffers=16, chunk_size=65536):
+    """
+    Runs a COPY ... TO STDOUT statement in a background thread, yielding its output as it is produced.
+
+    The statement runs on its own connection, which is returned to the pool when the generator finishes or is closed.
+    Output is yielded in chunks of about chunk_size bytes.  At most `buffers` chunks are held in memory at once; the
+    COPY waits if the client falls behind.
+
+    :param engine: Engine to run the statement on.
+    :param sql: COPY statement.
+    :param params: Parameters for the statement.  COPY doesn't accept bound parameters, so these are inlined by the
+        driver before the statement is sent.
+    :param buffers: Maximum number of chunks to queue.
+    :param chunk_size: Approximate size of each chunk, in bytes.
+    :return: Generator of bytes.
+    """
+    q = queue.Queue(maxsize=buffers)
+    cancelled = threading.Event()
+    done = object()
+
+    def produce():
+        connection = engine.raw_connection()
+        writer = _QueueWriter(q, cancelled, chunk_size)
+        try:
+            cursor = connection.cursor()
+            statement = cursor.mogrify(sql, params) if params else sql
+            cursor.copy_expert(statement, writer)
+            cursor.close()
+            connection.commit()
+            writer.flush()
+            q.put(done)
+        except Exception as ex:
+            connection.rollback()
+            if not cancelled.is_set():
+                try:
+                    # Send what was produced before the error, so the client sees where it stopped.
+                    writer.flush()
+                except IOError:
+                    pass
+                q.put(ex)
+        finally:
+            connection.close()
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = q.get()
+            if item is done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        cancelled.set()
+        thread.join()
+
+
+def _date_param(name):
+    try:
+        return datetime.datetime.strptime(bottle.request.query[name], '%Y-%m-%d').date()
+    except KeyError:
+        raise err.JSONValidationError("The '{}' parameter is required.".format(name))
+    except ValueError:
+        raise err.JSONValidationError("The '{}' parameter must be a date in YYYY-MM-DD format.".format(name))
+
+
+def export_attendance_view():
+    """
+    Handles GET /api/v2/export/attendance
+
+    Query parameters:
+        from, to: Inclusive range of attendance dates, in YYYY-MM-DD format.  Required.
+        activity, staff, category: Optional ids to filter by.
+        format: 'csv' (the default) or 'ndjson'.
+    """
+    try:
+        fmt = bottle.request.query.get('format', 'csv')
+        if fmt not in FORMATS:
+            raise err.JSONValidationError("Format must be one of: {}".format(", ".join(FORMATS)))
+        params = {'from': _date_param('from'), 'to': _date_param('to')}
+        query = ATTENDANCE_REPORT
+        for name, condition in ATTENDANCE_FILTERS.items():
+            value = bottle.request.query.get(name)
+            if value is None:
+                continue
+            try:
+                params[name] = int(value)
+            except ValueError:
+                raise err.JSONValidationError("The '{}' parameter must be an integer.".format(name))
+            query += "    AND " + condition + "\n"
+        query += "ORDER BY a.date, act.id, s.name_last, s.name_first"
+    except err.APIError as ex:
+        ex.modify_response(bottle.response)
+        return {'errors': [ex]}
+
+    content_type, copy = FORMATS[fmt]
+    # Same choice as RESTController.dispatch(): a replica, unless the client wrote something recently.
+    engine = latci.database.engine_for_read(primary=rest.is_pinned_to_primary())
+    output = stream_copy(engine, copy.format(query=query), params)
+    try:
+        # Fetch the first chunk now, so errors can still be reported properly.
+        first = next(output, b'')
+    except Exception:
+        output.close()
+        raise
+
+    def chain():
+        yield first
+        yield from output
+
+    bottle.response.content_type = content_type
+    bottle.response.set_header(
+        'Content-Disposition',
+        'attachment; filename="attendance-{}-{}.{}"'.format(params['from'], params['to'], fmt)
+    )
+    return chain()
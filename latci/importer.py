@@ -0,0 +1,319 @@
+"""
+latci.importer - Bulk import of students, staff, activities and enrollments from CSV or NDJSON.
+
+Imports run in three phases, all within the caller's transaction:
+
+1. The input is parsed and validated in a single streaming pass.  Valid rows are written to a spooled temporary file in
+   CSV format, invalid rows are reported by line number.
+2. The spooled rows are loaded into a temporary staging table with COPY, and rows referring to nonexistent objects are
+   removed from it (and reported.)
+3. The staging table is merged into the target table in a single statement.  Rows with an id update the existing row,
+   rows without one are inserted.
+
+The columns to import are determined by the CSV header, or by the keys of the first NDJSON record.  Columns that aren't
+included are left untouched on updates and receive their default value on inserts.
+"""
+import collections
+import csv
+import datetime
+import http.client
+import io
+import tempfile
+
+import bottle
+
+import latci.json
+import latci.api.errors as err
+
+
+def _parse_date(value):
+    return datetime.datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def _parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    value = value.lower().strip()
+    if value in ('y', 'yes', 't', 'true', 'on', '1'):
+        return True
+    if value in ('n', 'no', 'f', 'false', 'off', '0'):
+        return False
+    raise ValueError("'{}' is not a boolean.".format(value))
+
+
+# Describes an importable table.
+# columns: Dictionary of importable column names to converters.  'id' is always importable.
+# required: Columns that must be non-null, and present for inserts.
+# references: Dictionary of column names to the tables they refer to by id.
+ImportSpec = collections.namedtuple('ImportSpec', 'table columns required references')
+
+SPECS = {
+    'student': ImportSpec(
+        'student',
+        {'name_first': str, 'name_last': str},
+        ('name_first', 'name_last'),
+        {}
+    ),
+    'staff': ImportSpec(
+        'staff',
+        {'name_first': str, 'name_last': str, 'email': str, 'can_login': _parse_bool},
+        ('name_first', 'name_last'),
+        {}
+    ),
+    'activity': ImportSpec(
+        'activity',
+        {
+            'name': str, 'staff_id': int, 'location_id': int, 'category_id': int,
+            'start_date': _parse_date, 'end_date': _parse_date
+        },
+        ('name', 'staff_id', 'location_id', 'category_id', 'start_date', 'end_date'),
+        {'staff_id': 'staff', 'location_id': 'location', 'category_id': 'category'}
+    ),
+    'enrollment': ImportSpec(
+        'activity_enrollment',
+        {'activity_id': int, 'student_id': int, 'start_date': _parse_date, 'end_date': _parse_date},
+        ('activity_id', 'student_id', 'start_date'),
+        {'activity_id': 'activity', 'student_id': 'student'}
+    ),
+}
+
+FORMATS = {
+    'text/csv': 'csv',
+    'application/x-ndjson': 'ndjson',
+    'application/x-jsonlines': 'ndjson',
+}
+
+
+class ImportLineError(err.ValidationError):
+    name = 'import-line-error'
+    text = None
+    fmt = 'Line {line}: {message}'
+
+
+def _read_text(fp):
+    """Yields lines from a binary UTF-8 file, without closing it afterwards."""
+    text = io.TextIOWrapper(fp, encoding='utf-8-sig', newline='')
+    try:
+        yield from text
+    finally:
+        text.detach()
+
+
+def _read_csv(fp):
+    """Yields (line number, record) pairs from a binary CSV file.  The first line is the header."""
+    reader = csv.DictReader(_read_text(fp), restkey='(extra)')
+    for record in reader:
+        yield reader.line_num, record
+
+
+def _read_ndjson(fp):
+    """Yields (line number, record) pairs from a binary NDJSON file.  Blank lines are skipped."""
+    for line_num, line in enumerate(_read_text(fp), 1):
+        if not line.strip():
+            continue
+        try:
+            record = latci.json.loads(line)
+        except ValueError as ex:
+            yield line_num, ex
+            continue
+        yield line_num, record
+
+
+class Importer:
+    """
+    Imports one file into one table.
+
+    :ivar spec: ImportSpec of the target table.
+    :ivar errors: List of ImportLineErrors.
+    :ivar columns: Imported columns, in order.  Determined from the first record.
+    """
+    def __init__(self, db, kind):
+        """
+        :param db: Database session.
+        :param kind: Key of SPECS to import.
+        """
+        if kind not in SPECS:
+            raise err.NotFoundError("Unknown import type '{}'.".format(kind))
+        self.db = db
+        self.spec = SPECS[kind]
+        self.errors = []
+        self.columns = None
+
+    def error(self, line, message):
+        self.errors.append(ImportLineError(params={'line': line, 'message': message}))
+
+    def set_columns(self, names):
+        unknown = set(names) - set(self.spec.columns) - {'id'}
+        if unknown:
+            raise err.JSONValidationError("Unknown column(s): {}".format(", ".join(sorted(unknown))))
+        self.columns = [name for name in ['id'] + list(self.spec.columns) if name in names]
+
+    def validate(self, line, record):
+        """
+        Validates and converts a single record.
+
+        :return: List of values in self.columns order, or None if the record is invalid.
+        """
+        if not isinstance(record, dict):
+            self.error(line, "Record is not an object.")
+            return None
+        extra = set(record) - set(self.columns)
+        if extra:
+            self.error(line, "Unexpected field(s): {}".format(", ".join(sorted(extra))))
+            return None
+
+        row = []
+        for name in self.columns:
+            value = record.get(name)
+            if value == '':
+                value = None
+            if value is not None:
+                try:
+                    value = (int if name == 'id' else self.spec.columns[name])(value)
+                except (TypeError, ValueError):
+                    self.error(line, "Invalid value for {}.".format(name))
+                    return None
+            elif name in self.spec.required:
+                self.error(line, "{} is required.".format(name))
+                return None
+            row.append(value)
+
+        if 'id' not in self.columns or row[0] is None:
+            missing = [name for name in self.spec.required if name not in self.columns]
+            if missing:
+                self.error(line, "New records require {}.".format(", ".join(missing)))
+                return None
+        return row
+
+    def run(self, fp, fmt, skip_invalid=False):
+        """
+        Imports a file.
+
+        :param fp: Binary file-like object.
+        :param fmt: 'csv' or 'ndjson'
+        :param skip_invalid: If True, valid rows are imported even if some are invalid.  Otherwise, nothing is imported
+            if there are any errors.
+        :return: Dictionary with the number of 'inserted' and 'updated' rows.  Errors are in self.errors.
+        """
+        if fmt == 'csv':
+            records = _read_csv(fp)
+        elif fmt == 'ndjson':
+            records = _read_ndjson(fp)
+        else:
+            raise err.JSONValidationError("Unsupported import format.")
+
+        with tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024, mode='w+', newline='') as spool:
+            writer = csv.writer(spool)
+            seen_ids = set()
+            count = 0
+            for line, record in records:
+                if isinstance(record, Exception):
+                    self.error(line, "Invalid JSON: {}".format(record))
+                    continue
+                if self.columns is None:
+                    self.set_columns(list(record) if isinstance(record, dict) else [])
+                row = self.validate(line, record)
+                if row is None:
+                    continue
+                if 'id' in self.columns and row[0] is not None:
+                    if row[0] in seen_ids:
+                        self.error(line, "Duplicate id {}.".format(row[0]))
+                        continue
+                    seen_ids.add(row[0])
+                writer.writerow([line] + row)
+                count += 1
+
+            if not count or (self.errors and not skip_invalid):
+                return {'inserted': 0, 'updated': 0}
+            spool.seek(0)
+            self.stage(spool)
+
+        self.check_references()
+        if self.errors and not skip_invalid:
+            return {'inserted': 0, 'updated': 0}
+        return self.merge()
+
+    def stage(self, spool):
+        """Creates the staging table and loads the spooled rows into it with COPY."""
+        columns = ", ".join(self.columns)
+        self.db.execute(
+            "CREATE TEMP TABLE import_staging ON COMMIT DROP AS"
+            " SELECT NULL::INT AS line, {columns} FROM {table} WITH NO DATA".format(
+                columns=columns, table=self.spec.table
+            )
+        )
+        cursor = self.db.connection().connection.cursor()
+        try:
+            cursor.copy_expert("COPY import_staging (line, {}) FROM STDIN WITH CSV".format(columns), spool)
+        finally:
+            cursor.close()
+
+    def check_references(self):
+        """Removes staged rows that refer to nonexistent objects, recording an error for each."""
+        checks = [('id', self.spec.table)] + list(self.spec.references.items())
+        for column, table in checks:
+            if column not in self.columns:
+                continue
+            result = self.db.execute(
+                "DELETE FROM import_staging AS s"
+                " WHERE s.{column} IS NOT NULL AND NOT EXISTS(SELECT 1 FROM {table} AS t WHERE t.id=s.{column})"
+                " RETURNING s.line, s.{column}".format(column=column, table=table)
+            )
+            for line, value in sorted(result):
+                self.error(line, "{} {} does not exist.".format(column, value))
+
+    def merge(self):
+        """Merges the staging table into the target table with a single statement."""
+        table = self.spec.table
+        columns = [name for name in self.columns if name != 'id']
+        sql = (
+            "WITH inserted AS ("
+            " INSERT INTO {table} ({columns}) SELECT {columns} FROM import_staging WHERE {id_is_null} ORDER BY line"
+            " RETURNING 1"
+            ")"
+        )
+        if 'id' in self.columns:
+            sql += (
+                ", updated AS ("
+                " UPDATE {table} AS t SET {assignments} FROM import_staging AS s WHERE t.id=s.id"
+                " RETURNING 1"
+                ")"
+                " SELECT (SELECT COUNT(*) FROM inserted), (SELECT COUNT(*) FROM updated)"
+            )
+        else:
+            sql += " SELECT (SELECT COUNT(*) FROM inserted), 0"
+
+        inserted, updated = self.db.execute(sql.format(
+            table=table,
+            columns=", ".join(columns),
+            id_is_null='id IS NULL' if 'id' in self.columns else 'TRUE',
+            assignments=", ".join("{0}=s.{0}".format(name) for name in columns)
+        )).first()
+        return {'inserted': inserted, 'updated': updated}
+
+
+def import_view(kind, db=None):
+    """
+    Handles POST /api/v2/import/<kind>
+
+    The request body is CSV (Content-Type: text/csv) or NDJSON (Content-Type: application/x-ndjson).  Set
+    ?skip-invalid=1 to import valid rows even if others are invalid.
+    """
+    content_type = bottle.request.content_type.split(';')[0].strip().lower()
+    try:
+        fmt = FORMATS.get(content_type)
+        if fmt is None:
+            raise err.UnsupportedMediaTypeError("Content-Type must be one of: {}".format(", ".join(FORMATS)))
+        importer = Importer(db, kind)
+        result = importer.run(bottle.request.body, fmt, skip_invalid=bool(bottle.request.query.get('skip-invalid')))
+    except err.APIError as ex:
+        db.rollback()
+        ex.modify_response(bottle.response)
+        return {'errors': [ex]}
+
+    if importer.errors and not bottle.request.query.get('skip-invalid'):
+        db.rollback()
+        bottle.response.status = http.client.BAD_REQUEST
+        return {'data': result, 'errors': importer.errors}
+    db.commit()
+    return {'data': result, 'errors': importer.errors}
@@ -28,3 +28,75 @@ dump = functools.partial(json.dump, cls=JSONEncoder)
 dumps = functools.partial(json.dumps, cls=JSONEncoder)
 load = json.load
 loads = json.loads
+
+
+def iter_array(fp, encoding='utf-8', chunk_size=65536):
+    """
+    Incrementally parses a JSON array from a binary file-like object, yielding one element at a time.
+
+    Only the element currently being parsed (plus up to chunk_size bytes of lookahead) is held in memory, so arbitrarily
+    large arrays can be processed with bounded memory.
+
+    :param fp: Binary file-like object positioned at the start of the array.
+    :param encoding: Text encoding of the input.
+    :param chunk_size: Number of bytes to read at a time.
+    :return: Generator of array elements.
+    :raises ValueError: If the input is not a well-formed JSON array.
+    """
+    import codecs
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder(encoding)()
+    buffer = ''
+    pos = 0
+    eof = False
+
+    def fill():
+        nonlocal buffer, pos, eof
+        data = fp.read(chunk_size)
+        eof = not data
+        buffer = buffer[pos:] + text_decoder.decode(data, final=eof)
+        pos = 0
+
+    def skip_whitespace():
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos].isspace():
+                pos += 1
+            if pos < len(buffer) or eof:
+                return
+            fill()
+
+    skip_whitespace()
+    if buffer[pos:pos + 1] != '[':
+        raise ValueError("Expected a JSON array.")
+    pos += 1
+    skip_whitespace()
+    if buffer[pos:pos + 1] == ']':
+        return
+
+    while True:
+        # Parse the next element, reading more input until it is complete.
+        while True:
+            try:
+                element, end = decoder.raw_decode(buffer, pos)
+            except ValueError:
+                if eof:
+                    raise
+                fill()
+                continue
+            if end == len(buffer) and not eof:
+                # A number at the end of the buffer might continue in the next chunk.
+                fill()
+                continue
+            break
+        pos = end
+        yield element
+
+        skip_whitespace()
+        separator = buffer[pos:pos + 1]
+        pos += 1
+        if separator == ']':
+            return
+        if separator != ',':
+            raise ValueError("Expected ',' or ']' in JSON array.")
+        skip_whitespace()
@@ -0,0 +1,177 @@
+"""
+latci.log - Non-blocking structured logging.
+
+Log records are put on a bounded queue by the thread that logs them and written out as JSON lines by a background
+thread, so a slow log destination or a burst of exceptions never delays a request.  Formatting (including tracebacks)
+also happens in the background thread.  If the queue is full, records are dropped and counted rather than waited on.
+
+Each request gets an id, taken from the X-Request-Id header if the client (or a proxy) sent one, which is echoed back
+in the response and attached to everything logged while handling it.
+"""
+import atexit
+import datetime
+import logging
+import logging.handlers
+import queue
+import sys
+import time
+import traceback
+import uuid
+
+import bottle
+
+import latci.json
+
+REQUEST_ID_HEADER = 'X-Request-Id'
+
+# Request attributes included in every record logged during a request, as environ key -> JSON field.
+_REQUEST_FIELDS = {
+    'latci.request_id': 'request_id',
+    'latci.controller': 'controller',
+}
+
+logger = logging.getLogger('latci')
+request_logger = logging.getLogger('latci.requests')
+
+_listener = None
+
+
+class JSONFormatter(logging.Formatter):
+    """Formats records as single-line JSON objects."""
+    # Standard LogRecord attributes, which are not copied into the output as extra fields.
+    _reserved = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+    def format(self, record):
+        entry = {
+            'time': datetime.datetime.utcfromtimestamp(record.created).isoformat() + 'Z',
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in self._reserved and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info and record.exc_info[0] is not None:
+            entry['exception'] = {
+                'type': record.exc_info[0].__name__,
+                'message': str(record.exc_info[1]),
+                'traceback': ''.join(traceback.format_exception(*record.exc_info)),
+            }
+        try:
+            return latci.json.dumps(entry)
+        except (TypeError, ValueError):
+            return latci.json.dumps({
+                key: value if isinstance(value, (str, int, float, bool, type(None), dict)) else repr(value)
+                for key, value in entry.items()
+            })
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that adds request context, leaves formatting to the listener thread and never blocks.
+
+    :ivar dropped: Number of records discarded because the queue was full.
+    """
+    def __init__(self, q):
+        super().__init__(q)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # The stock implementation formats the record here, in the logging thread.  Instead, only capture what is
+        # specific to this thread; the traceback stays attached until the listener formats it.
+        try:
+            environ = bottle.request.environ
+        except (AttributeError, RuntimeError, KeyError):
+            environ = {}
+        for key, field in _REQUEST_FIELDS.items():
+            if key in environ and not hasattr(record, field):
+                setattr(record, field, environ[key])
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def setup(level='INFO', filename=None, queue_size=10000, debug_sql=False):
+    """
+    Routes all logging through a queue to a background writer thread.  Safe to call more than once.
+
+    :param level: Minimum level to log.
+    :param filename: File to append JSON lines to.  None means stderr.
+    :param queue_size: Maximum number of records waiting to be written.
+    :param debug_sql: If True, also log every SQL statement.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    if filename:
+        output = logging.FileHandler(filename, encoding='utf-8')
+    else:
+        output = logging.StreamHandler(sys.stderr)
+    output.setFormatter(JSONFormatter())
+
+    q = queue.Queue(queue_size)
+    handler = _QueueHandler(q)
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(level)
+    if debug_sql:
+        logging.getLogger('sqlalchemy.engine').setLevel(logging.INFO)
+
+    _listener = logging.handlers.QueueListener(q, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown)
+
+
+def shutdown():
+    """Writes out any queued records and stops the background thread."""
+    global _listener
+    if _listener is None:
+        return
+    _listener.stop()
+    _listener = None
+    for handler in logging.getLogger().handlers:
+        if isinstance(handler, _QueueHandler) and handler.dropped:
+            sys.stderr.write("latci.log: {} log records were dropped.\n".format(handler.dropped))
+
+
+def start_request():
+    """bottle 'before_request' hook.  Assigns the request id and starts the request timer."""
+    environ = bottle.request.environ
+    environ['latci.started'] = time.perf_counter()
+    request_id = bottle.request.get_header(REQUEST_ID_HEADER)
+    if not request_id or len(request_id) > 200:
+        request_id = uuid.uuid4().hex
+    environ['latci.request_id'] = request_id
+    bottle.response.set_header(REQUEST_ID_HEADER, request_id)
+
+
+def finish_request():
+    """bottle 'after_request' hook.  Logs the request."""
+    environ = bottle.request.environ
+    started = environ.get('latci.started')
+    if started is None:
+        return
+    request_logger.info(
+        "%s %s %s", bottle.request.method, bottle.request.path, bottle.response.status_code,
+        extra={
+            'method': bottle.request.method,
+            'path': bottle.request.path,
+            'status': bottle.response.status_code,
+            'duration_ms': round((time.perf_counter() - started) * 1000, 3),
+        }
+    )
+
+
+def install(app):
+    """
+    Installs the request hooks on a bottle application.
+
+    :param app: Bottle application.
+    """
+    app.add_hook('before_request', start_request)
+    app.add_hook('after_request', finish_request)
@@ -0,0 +1,270 @@
+"""
+latci.middleware - WSGI middleware wrapped around the application.
+"""
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def _gzip_compressor(level):
+    return zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+
+def _deflate_compressor(level):
+    return zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS)
+
+
+class _BrotliCompressor:
+    """Adapts brotli's compressor to the zlib compressobj interface."""
+    def __init__(self, level):
+        # Brotli quality runs from 0 to 11, zlib levels from 1 to 9.
+        self.compressor = brotli.Compressor(quality=min(11, max(0, level + 2)))
+
+    def compress(self, data):
+        return self.compressor.process(data)
+
+    def flush(self, mode=zlib.Z_FINISH):
+        if mode == zlib.Z_FINISH:
+            return self.compressor.finish()
+        return self.compressor.flush()
+
+
+# Supported content codings, in order of preference when the client has no preference of its own.
+CODECS = {}
+if brotli is not None:
+    CODECS['br'] = _BrotliCompressor
+CODECS['gzip'] = _gzip_compressor
+CODECS['deflate'] = _deflate_compressor
+
+# Content types worth compressing.  Anything else (images, archives, ...) is usually already compressed.
+COMPRESSIBLE_TYPES = {
+    'application/json', 'application/javascript', 'application/x-javascript', 'application/xml',
+    'application/x-ndjson', 'application/x-jsonlines', 'image/svg+xml',
+}
+
+
+def negotiate_encoding(accept_encoding, codecs=CODECS):
+    """
+    Chooses a content coding based on an Accept-Encoding header.
+
+    :param accept_encoding: Value of the Accept-Encoding header, or None.
+    :param codecs: Available codecs, in order of preference.
+    :return: Name of the chosen coding, or None if the response should not be compressed.
+    """
+    if not accept_encoding:
+        return None
+    qvalues = {}
+    for item in accept_encoding.split(','):
+        coding, *params = (part.strip() for part in item.split(';'))
+        if not coding:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        qvalues[coding.lower()] = q
+
+    best, best_q = None, 0.0
+    for coding in codecs:
+        q = qvalues.get(coding, qvalues.get('*', 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def _is_compressible(content_type):
+    content_type = content_type.split(';')[0].strip().lower()
+    return content_type.startswith('text/') or content_type in COMPRESSIBLE_TYPES
+
+
+class CompressionMiddleware:
+    """
+    Compresses response bodies using the best coding the client accepts.
+
+    Responses are left alone if they are already encoded, aren't of a compressible type, ask for no-transform, or are
+    smaller than min_size.  Bodies of unknown length (such as streamed exports) are buffered only until min_size is
+    reached, and then compressed and passed on chunk by chunk.  Bodies that are already encoded, of an incompressible
+    type or wrapped with wsgi.file_wrapper are returned to the server as the same object, so it can still send files
+    with sendfile().
+    """
+    def __init__(self, app, min_size=1024, level=6, codecs=CODECS):
+        """
+        :param app: WSGI application to wrap.
+        :param min_size: Bodies smaller than this many bytes are sent uncompressed.
+        :param level: Compression level, 1-9.
+        :param codecs: Dictionary of available codings to compressor factories, in order of preference.
+        """
+        self.app = app
+        self.min_size = min_size
+        self.level = level
+        self.codecs = codecs
+
+    def __call__(self, environ, start_response):
+        coding = negotiate_encoding(environ.get('HTTP_ACCEPT_ENCODING'), self.codecs)
+        state = {}
+
+        def capture_start_response(status, headers, exc_info=None):
+            if exc_info and state.get('started'):
+                try:
+                    raise exc_info[1].with_traceback(exc_info[2])
+                finally:
+                    exc_info = None
+            state['status'] = status
+            state['headers'] = headers
+            state['exc_info'] = exc_info
+            return self._unsupported_write
+
+        result = self.app(environ, capture_start_response)
+        iterator = None
+        pending = []
+        exhausted = False
+        try:
+            # The application may defer start_response() until its first chunk, so nothing about the response is known
+            # until it has been called.  The body isn't touched otherwise, in case it is handed back unchanged below.
+            if 'status' not in state:
+                iterator = iter(result)
+            while 'status' not in state:
+                chunk = next(iterator, None)
+                if chunk is None:
+                    if 'status' not in state:
+                        raise RuntimeError("Application returned without calling start_response().")
+                    exhausted = True
+                    break
+                pending.append(chunk)
+        except BaseException:
+            if hasattr(result, 'close'):
+                result.close()
+            raise
+
+        status = state['status']
+        headers = state['headers']
+        values = {name.lower(): value for name, value in headers}
+        file_wrapper = environ.get('wsgi.file_wrapper')
+        if (
+            (isinstance(file_wrapper, type) and isinstance(result, file_wrapper))
+            or 'content-encoding' in values
+            or not _is_compressible(values.get('content-type', ''))
+        ):
+            # Hand the body back untouched, so the server can still recognize a file_wrapper and use sendfile().
+            start_response(status, headers, state['exc_info'])
+            state['started'] = True
+            if not pending:
+                return result
+            return self._passthrough(pending, iterator, result)
+
+        if iterator is None:
+            iterator = iter(result)
+        return self._respond(environ, start_response, result, iterator, pending, exhausted, state, coding)
+
+    @staticmethod
+    def _unsupported_write(data):
+        raise NotImplementedError("CompressionMiddleware does not support the WSGI write() callable.")
+
+    @staticmethod
+    def _passthrough(pending, iterator, result):
+        """Generator producing chunks that were already read, followed by the rest of the body."""
+        try:
+            yield from pending
+            yield from iterator
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+
+    def _respond(self, environ, start_response, result, iterator, pending, exhausted, state, coding):
+        """Generator producing the (possibly compressed) body of a response with a compressible content type."""
+        try:
+            status = state['status']
+            headers = self._add_vary(state['headers'])
+            values = {name.lower(): value for name, value in headers}
+
+            compressible = (
+                coding is not None
+                and 'no-transform' not in values.get('cache-control', '').lower()
+                and int(status.split()[0]) not in (204, 206, 304)
+                and environ.get('REQUEST_METHOD') != 'HEAD'
+            )
+            if compressible and 'content-length' in values:
+                compressible = int(values['content-length']) >= self.min_size
+            if not compressible:
+                start_response(status, headers, state['exc_info'])
+                state['started'] = True
+                yield from pending
+                if not exhausted:
+                    yield from iterator
+                return
+
+            # Buffer until we know the body is big enough to be worth compressing.
+            if not pending and isinstance(result, (list, tuple)):
+                pending = list(result)
+                exhausted = True
+            size = sum(len(chunk) for chunk in pending)
+            while not exhausted and size < self.min_size:
+                chunk = next(iterator, None)
+                if chunk is None:
+                    exhausted = True
+                    break
+                pending.append(chunk)
+                size += len(chunk)
+
+            if size < self.min_size:
+                start_response(status, headers, state['exc_info'])
+                state['started'] = True
+                yield from pending
+                return
+
+            headers = [
+                (name, value) for name, value in headers if name.lower() not in ('content-length', 'content-encoding')
+            ]
+            headers.append(('Content-Encoding', coding))
+            headers = self._weaken_etag(headers)
+
+            compressor = self.codecs[coding](self.level)
+            if exhausted:
+                # The whole body is in hand, so it can be sent with a length.
+                body = compressor.compress(b''.join(pending)) + compressor.flush()
+                headers.append(('Content-Length', str(len(body))))
+                start_response(status, headers, state['exc_info'])
+                state['started'] = True
+                yield body
+                return
+
+            start_response(status, headers, state['exc_info'])
+            state['started'] = True
+            data = compressor.compress(b''.join(pending))
+            pending = None
+            for chunk in iterator:
+                # Flush after every chunk, so streamed responses stay streamed.
+                data += compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+                if data:
+                    yield data
+                    data = b''
+            yield data + compressor.flush()
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+
+    @staticmethod
+    def _add_vary(headers):
+        for index, (name, value) in enumerate(headers):
+            if name.lower() == 'vary':
+                fields = [field.strip().lower() for field in value.split(',')]
+                if 'accept-encoding' not in fields and '*' not in fields:
+                    headers = list(headers)
+                    headers[index] = (name, value + ', Accept-Encoding')
+                return headers
+        return list(headers) + [('Vary', 'Accept-Encoding')]
+
+    @staticmethod
+    def _weaken_etag(headers):
+        # The compressed body is no longer byte-for-byte identical to what a strong ETag describes.
+        return [
+            (name, 'W/' + value) if name.lower() == 'etag' and not value.startswith('W/') else (name, value)
+            for name, value in headers
+        ]
@@ -5,6 +5,10 @@ import bottle
 import functools
 import latci.config
 import http.client
+import logging
+import traceback
+
+logger = logging.getLogger(__name__)
 
 # How should the backend handle uncaught exceptions
 # 'native' - Let the web framework do its normal thing with exceptions.
@@ -41,8 +45,11 @@ def wrap_exceptions(fn, mode=_exception_mode):
         except bottle.HTTPResponse:
             raise
         except Exception as ex:
-            import traceback
-            print(traceback.format_exc())
+            # Formatted by the logging thread, not here.
+            logger.error(
+                "Unhandled exception in %s", getattr(fn, '__qualname__', fn), exc_info=True,
+                extra={'method': bottle.request.method, 'path': bottle.request.path}
+            )
             if mode == 'silent':
                 bottle.abort(500, '')
                 return  # Unreachable
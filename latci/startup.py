@@ -0,0 +1,56 @@
+"""
+latci.startup - Startup timing and warm-up.
+
+Expensive initialization (mapper configuration, schema generation, the authentication libraries and database
+connections) otherwise happens on first use, which makes startup fast but the first requests slow.  warm_up() does all
+of it in advance, for servers that can run it before the worker starts accepting traffic.
+"""
+import contextlib
+import time
+
+# (name, seconds) for each phase timed so far, in order.
+phases = []
+
+
+@contextlib.contextmanager
+def phase(name):
+    """
+    Context manager that records how long its body takes as a startup phase.
+
+    :param name: Phase name.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        phases.append((name, time.perf_counter() - started))
+
+
+def warm_up(connections=1):
+    """
+    Performs initialization that would otherwise be deferred until the first request that needs it.
+
+    :param connections: Number of connections to open in each engine's pool.
+    """
+    import latci.database
+    from latci.database import models
+
+    with phase('warm-up: mappers and schemas'):
+        models.setup_schema()
+
+    with phase('warm-up: authentication libraries'):
+        import oauth2client.client
+        import oauth2client.crypt
+
+    with phase('warm-up: connection pools'):
+        for engine in [latci.database.engine] + latci.database.replica_engines:
+            # Hold them all at once, so the pool has to open that many.
+            opened = []
+            try:
+                for _ in range(connections):
+                    conn = engine.connect()
+                    opened.append(conn)
+                    conn.execute("SELECT 1")
+            finally:
+                for conn in opened:
+                    conn.close()
@@ -0,0 +1,204 @@
+"""
+latci.static - Serving of the static client files.
+
+Builds made by build.py contain content-hashed copies of the client's assets, listed in asset-manifest.json, along with
+precompressed .gz siblings.  Fingerprinted files never change, so they are served with far-future caching; everything
+else must be revalidated on every use.
+
+Files are held in memory after they are first read, along with their validators, so serving one (or answering a
+conditional request for one) normally touches neither the disk nor the filesystem metadata.  Cached files are checked
+for changes at most once every few seconds.  Large files aren't cached, and are handed to the server's
+wsgi.file_wrapper instead, which can use sendfile().
+"""
+import email.utils
+import mimetypes
+import os
+import threading
+import time
+
+import bottle
+
+import latci.json
+from latci.middleware import negotiate_encoding
+
+MANIFEST_NAME = 'asset-manifest.json'
+
+# One year, the longest lifetime most caches honor.
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE_CONTROL = 'no-cache'
+
+
+def load_manifest(root):
+    """
+    Returns the set of fingerprinted paths listed in root's asset manifest, or an empty set if there isn't one.
+
+    :param root: Static files directory.
+    """
+    try:
+        with open(os.path.join(root, MANIFEST_NAME), encoding='utf-8') as fp:
+            return set(latci.json.load(fp).values())
+    except (OSError, ValueError):
+        return set()
+
+
+class CachedFile:
+    """
+    A static file's metadata, and its contents if it is small enough to keep in memory.
+
+    :ivar filename: Absolute path to the file.
+    :ivar mtime: Modification time, in nanoseconds.
+    :ivar size: Size in bytes.
+    :ivar data: File contents, or None if the file is too large to cache.
+    :ivar etag: ETag header value.
+    :ivar last_modified: Last-Modified header value.
+    :ivar checked: time.monotonic() of the last check for changes.
+    """
+    __slots__ = ('filename', 'mtime', 'size', 'data', 'etag', 'last_modified', 'checked')
+
+    def __init__(self, filename, stat, max_size, tag=''):
+        self.filename = filename
+        self.mtime = stat.st_mtime_ns
+        self.size = stat.st_size
+        self.data = None
+        if self.size <= max_size:
+            with open(filename, 'rb') as fp:
+                self.data = fp.read()
+            self.size = len(self.data)
+        self.etag = '"{:x}-{:x}{}"'.format(self.mtime, self.size, tag)
+        self.last_modified = email.utils.formatdate(stat.st_mtime, usegmt=True)
+        self.checked = time.monotonic()
+
+    def is_current(self, stat):
+        return stat.st_mtime_ns == self.mtime and stat.st_size == self.size
+
+    def not_modified(self, request):
+        """Returns True if the request's conditional headers are satisfied by this version of the file."""
+        if_none_match = request.get_header('If-None-Match')
+        if if_none_match is not None:
+            # If-None-Match uses weak comparison, and takes precedence over If-Modified-Since.
+            tags = {tag.strip()[2:] if tag.strip().startswith('W/') else tag.strip() for tag in if_none_match.split(',')}
+            return '*' in tags or self.etag in tags
+        if_modified_since = request.get_header('If-Modified-Since')
+        if if_modified_since is not None:
+            since = email.utils.parsedate_tz(if_modified_since.split(';')[0].strip())
+            if since is not None:
+                return self.mtime // 1000000000 <= email.utils.mktime_tz(since)
+        return False
+
+
+class StaticFiles:
+    """
+    Serves files from a directory, preferring precompressed variants and applying cache headers based on the manifest.
+    """
+    def __init__(self, root, max_cached_size=1024 * 1024, check_interval=2.0):
+        """
+        :param root: Static files directory.
+        :param max_cached_size: Files larger than this many bytes are read from disk on each request.
+        :param check_interval: Minimum number of seconds between checks of a cached file for changes.  Fingerprinted
+            files are never checked.
+        """
+        self.root = os.path.abspath(root)
+        self.max_cached_size = max_cached_size
+        self.check_interval = check_interval
+        self.fingerprinted = load_manifest(self.root)
+        self.cache = {}
+        self.missing = {}  # Paths known not to exist, and when they were last checked
+        self.lock = threading.Lock()
+
+    def cache_control(self, path):
+        return IMMUTABLE_CACHE_CONTROL if path in self.fingerprinted else REVALIDATE_CACHE_CONTROL
+
+    def preload(self):
+        """Loads every file under root into the cache.  Optional; files are otherwise loaded on first use."""
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            for filename in filenames:
+                path = os.path.relpath(os.path.join(dirpath, filename), self.root).replace(os.sep, '/')
+                self.lookup(path[:-3] if path.endswith('.gz') else path, path.endswith('.gz'))
+
+    def lookup(self, path, compressed=False):
+        """
+        Returns the CachedFile for a path, loading or refreshing it if needed.
+
+        :param path: Path relative to root.
+        :param compressed: If True, look for the precompressed .gz variant instead.
+        :return: A CachedFile, or None if the file does not exist.
+        """
+        key = (path, compressed)
+        entry = self.cache.get(key)
+        now = time.monotonic()
+        if entry is not None and (path in self.fingerprinted or now - entry.checked < self.check_interval):
+            return entry
+        if entry is None and now - self.missing.get(key, -self.check_interval) < self.check_interval:
+            return None
+
+        filename = os.path.abspath(os.path.join(self.root, path.lstrip('/\\') + ('.gz' if compressed else '')))
+        if not filename.startswith(self.root + os.sep):
+            return None
+        try:
+            stat = os.stat(filename)
+        except OSError:
+            stat = None
+        if stat is None or not os.path.isfile(filename):
+            with self.lock:
+                self.cache.pop(key, None)
+                if len(self.missing) >= 10000:
+                    # Don't let requests for random paths grow this without bound.
+                    self.missing.clear()
+                self.missing[key] = now
+            return None
+        if entry is not None and entry.is_current(stat):
+            entry.checked = now
+            return entry
+
+        try:
+            entry = CachedFile(filename, stat, self.max_cached_size, tag='-gz' if compressed else '')
+        except OSError:
+            return None
+        with self.lock:
+            self.cache[key] = entry
+            self.missing.pop(key, None)
+        return entry
+
+    def __call__(self, path):
+        """
+        Returns a response for the file at path (relative to root).
+
+        :param path: Requested path.
+        :return: bottle.HTTPResponse or bottle.HTTPError
+        """
+        request = bottle.request
+        entry = None
+        encoding = None
+        if negotiate_encoding(request.get_header('Accept-Encoding'), ('gzip',)) == 'gzip':
+            entry = self.lookup(path, compressed=True)
+            if entry is not None:
+                encoding = 'gzip'
+        if entry is None:
+            entry = self.lookup(path)
+        if entry is None:
+            return bottle.HTTPError(404, "File does not exist.")
+
+        headers = {
+            'Content-Type': mimetypes.guess_type(path)[0] or 'application/octet-stream',
+            'ETag': entry.etag,
+            'Last-Modified': entry.last_modified,
+            'Cache-Control': self.cache_control(path),
+            'Vary': 'Accept-Encoding',
+        }
+        if headers['Content-Type'].startswith('text/') or headers['Content-Type'] == 'application/javascript':
+            headers['Content-Type'] += '; charset=UTF-8'
+        if encoding:
+            headers['Content-Encoding'] = encoding
+
+        if entry.not_modified(request):
+            return bottle.HTTPResponse(status=304, **headers)
+
+        headers['Content-Length'] = str(entry.size)
+        if request.method == 'HEAD':
+            body = ''
+        elif entry.data is not None:
+            body = entry.data
+        else:
+            # bottle passes open files to wsgi.file_wrapper when the server provides one.
+            body = open(entry.filename, 'rb')
+        return bottle.HTTPResponse(body, **headers)
@@ -1,28 +1,48 @@
+import datetime
+
+import bottle
+
 from latci.api import rest
+from latci.auth import auth_wrapper
+import latci.changes
+import latci.exporter
+import latci.importer
+import latci.misc
+import latci.api.errors as err
 from latci.database import models
-from latci.api.references import ScalarReferenceManager
+from latci.api.references import ScalarReferenceManager, CompositeReferenceManager
+
+
+class _ModelSchemaClass():
+    """Defers to the model's SchemaClass, so that it isn't generated until a request needs it."""
+    def __get__(self, instance, owner):
+        return owner.model.SchemaClass if owner.model else None
 
 
-class SimpleIDRestController(rest.RESTController):
+class ModelRestController(rest.RESTController):
+    SchemaClass = _ModelSchemaClass()
+
+
+class SimpleIDRestController(ModelRestController):
     url_instance = '<key:int>'
 
     @classmethod
     def create_manager(cls):
         return ScalarReferenceManager.from_controller(cls, column='id')
 
-    @classmethod
-    def setup(cls):
-        super().setup()
-        if not cls.model:
-            return
 
-        if getattr(cls, 'SchemaClass', None) is None:
-            cls.SchemaClass = getattr(cls.model, 'SchemaClass')
+class CompositeKeyRestController(ModelRestController):
+    url_instance = '<key>'
+
+    @classmethod
+    def create_manager(cls):
+        return CompositeReferenceManager.from_controller(cls)
 
 
 # noinspection PyAbstractClass
-class StudentRestController(SimpleIDRestController, rest.SortableRESTController, rest.InactiveFilterRESTController):
+class StudentRestController(SimpleIDRestController, rest.SortableRESTController, rest.DeltaSyncRESTController):
     model = models.Student
+    archive_model = models.StudentArchive
     name = 'student'
 
     allow_fetch = True
@@ -37,13 +57,14 @@ class StudentRestController(SimpleIDRestController, rest.SortableRESTController,
     def get_schema(self):
         return self.SchemaClass(
             exclude=('id', 'enrollment'),
-            dump_only=('date_inactive', 'date_created')
+            dump_only=('date_inactive', 'date_created', 'modseq')
         )
 
 
 # noinspection PyAbstractClass
-class StaffRestController(SimpleIDRestController, rest.SortableRESTController, rest.InactiveFilterRESTController):
+class StaffRestController(SimpleIDRestController, rest.SortableRESTController, rest.DeltaSyncRESTController):
     model = models.Staff
+    archive_model = models.StaffArchive
     name = 'staff'
 
     allow_fetch = True
@@ -58,13 +79,14 @@ class StaffRestController(SimpleIDRestController, rest.SortableRESTController, r
     def get_schema(self):
         return self.SchemaClass(
             exclude=('id', 'activities'),
-            dump_only=('date_inactive', 'date_created')
+            dump_only=('date_inactive', 'date_created', 'modseq')
         )
 
 
 # noinspection PyAbstractClass
-class ActivityRestController(SimpleIDRestController, rest.SortableRESTController, rest.InactiveFilterRESTController):
+class ActivityRestController(SimpleIDRestController, rest.SortableRESTController, rest.DeltaSyncRESTController):
     model = models.Activity
+    archive_model = models.ActivityArchive
     name = 'activity'
 
     allow_fetch = True
@@ -79,8 +101,80 @@ class ActivityRestController(SimpleIDRestController, rest.SortableRESTController
     def get_schema(self):
         return self.SchemaClass(
             exclude=('id', 'enrollment', 'staff', 'location', 'category'),
-            dump_only=('date_inactive', 'date_created')
+            dump_only=('date_inactive', 'date_created', 'modseq')
+        )
+
+
+
+# noinspection PyAbstractClass
+class AttendanceHistoryRestController(SimpleIDRestController, rest.SortableRESTController):
+    """
+    Read-only access to attendance history.
+
+    Collection GETs require 'from' and 'to' options (inclusive attendance dates in YYYY-MM-DD format) so that only the
+    relevant attendance_history partitions are scanned.  Results may also be filtered with the 'student' and 'activity'
+    options.
+    """
+    model = models.AttendanceHistory
+    name = 'attendance-history'
+
+    allow_fetch = True
+    sortable_columns = {v: [v] for v in ('date', 'date_entered', 'id')}
+
+    def get_date_option(self, option):
+        value = self.options.get(option)
+        if value is None:
+            raise err.JSONValidationError("The '{}' option is required.".format(option))
+        try:
+            return datetime.datetime.strptime(value, '%Y-%m-%d').date()
+        except (TypeError, ValueError):
+            raise err.JSONValidationError("The '{}' option must be a date in YYYY-MM-DD format.".format(option))
+
+    def query(self, ref=None, from_refresh=False, session=None):
+        query = super().query(ref, from_refresh, session)
+        if ref is not None:
+            return query
+
+        query = query.filter(self.model.date.between(self.get_date_option('from'), self.get_date_option('to')))
+        for option in 'student', 'activity':
+            value = self.options.get(option)
+            if value is not None:
+                query = query.filter(getattr(self.model, option + '_id') == int(value))
+        return query
+
+
+# noinspection PyAbstractClass
+class AttendanceRestController(CompositeKeyRestController, rest.SortableRESTController):
+    """
+    Attendance records, keyed by (student_id, activity_id, date).  Item URLs look like /api/v2/attendance/12,3,2015-10-01
+    """
+    model = models.Attendance
+    name = 'attendance'
+
+    allow_fetch = True
+    allow_create = True
+    allow_update = True
+    treat_put_as_patch = True
+    sortable_columns = {v: [v] for v in ('date', 'student_id', 'activity_id', 'date_entered')}
+
+    def get_schema(self):
+        return self.SchemaClass(
+            exclude=('student', 'activity', 'status'),
+            dump_only=('date_entered',)
         )
 
 
+bottle.route(
+    rest.RESTController.url_prefix + 'import/<kind>', method='POST',
+    callback=latci.misc.wrap_exceptions(auth_wrapper(keyword='auth', fn=latci.importer.import_view))
+)
+bottle.route(
+    rest.RESTController.url_prefix + 'export/attendance', method='GET',
+    callback=latci.misc.wrap_exceptions(auth_wrapper(fn=latci.exporter.export_attendance_view))
+)
+bottle.route(
+    rest.RESTController.url_prefix + 'changes', method='GET',
+    callback=latci.misc.wrap_exceptions(auth_wrapper(fn=latci.changes.changes_view))
+)
+
 rest.setup_all()